@@ -0,0 +1,138 @@
+"""Query-plan regression check for the resolver SQL.
+
+Optionally seeds a large synthetic dataset (bench.seed), then runs
+EXPLAIN (ANALYZE, BUFFERS) for every resolver and loader query. Fails when
+a plan sequentially scans a large table, or when its estimated cost grows
+beyond the recorded baseline.
+
+    python -m bench.explain_check --seed 20000 --update-baseline
+    python -m bench.explain_check
+"""
+import argparse
+import json
+import os
+import sys
+import psycopg
+from bench.seed import DATABASE_URL, seed
+
+BASELINE_FILE = os.path.join(os.path.dirname(__file__), "plan_baseline.json")
+
+# Resolver and loader statements with representative arguments; keep in sync
+# with main.py, loaders.py and pagination.py. Usernames follow bench.seed:
+# 'user<n>_5' on a first seed over init.sql's 5 users.
+QUERIES = {
+    "Query.user": ("SELECT * FROM users WHERE id = %s", (42,)),
+    "Query.userByUsername": ("SELECT * FROM users WHERE username = 'user42_5'", None),
+    "Query.post": ("SELECT * FROM posts WHERE id = %s", (42,)),
+    "Query.posts(authorId)": ("SELECT * FROM posts WHERE author_id = %s", (42,)),
+    "Query.comments": ("SELECT * FROM comments WHERE post_id = %s", (42,)),
+    "Query.product": ("SELECT * FROM products WHERE id = %s", (42,)),
+    "Query.order": ("SELECT * FROM orders WHERE id = %s", (42,)),
+    "Query.orders(userId)": ("SELECT * FROM orders WHERE user_id = %s", (42,)),
+    "Query.messages": (
+        "SELECT * FROM messages WHERE from_user_id = %s "
+        "UNION ALL "
+        "SELECT * FROM messages WHERE to_user_id = %s AND from_user_id IS DISTINCT FROM %s",
+        (42, 42, 42),
+    ),
+    "Query.searchUsers": (
+        "SELECT users.* FROM user_search JOIN users ON users.id = user_search.user_id, "
+        "plainto_tsquery('simple', 'user4242_5') AS q "
+        "WHERE user_search.document @@ q ORDER BY ts_rank(user_search.document, q) DESC, users.id "
+        "LIMIT 20 OFFSET 0",
+        None,
+    ),
+    "Query.userTypeahead": (
+        "SELECT users.* FROM user_search JOIN users ON users.id = user_search.user_id "
+        "WHERE user_search.document @@ to_tsquery('simple', %s) "
+        "ORDER BY length(users.username), users.id LIMIT %s",
+        ("user424:*", 10),
+    ),
+    "Query.postsConnection": (
+        "SELECT * FROM posts WHERE (created_at, id) > (now() - interval '1 hour', 0) "
+        "ORDER BY created_at, id LIMIT 51",
+        None,
+    ),
+    "Query.postsConnection(authorId)": (
+        "SELECT * FROM posts WHERE author_id = %s ORDER BY created_at, id LIMIT 51",
+        (42,),
+    ),
+    "Query.ordersConnection(userId)": (
+        "SELECT * FROM orders WHERE user_id = %s ORDER BY created_at, id LIMIT 51",
+        (42,),
+    ),
+    "Query.messagesConnection": (
+        "(SELECT * FROM messages WHERE from_user_id = %s AND (created_at, id) > (now() - interval '1 day', 0) "
+        "ORDER BY created_at, id LIMIT 51) "
+        "UNION ALL "
+        "(SELECT * FROM messages WHERE to_user_id = %s AND from_user_id IS DISTINCT FROM %s "
+        "AND (created_at, id) > (now() - interval '1 day', 0) ORDER BY created_at, id LIMIT 51) "
+        "ORDER BY created_at, id LIMIT 51",
+        (42, 42, 42),
+    ),
+    "loader.user": ("SELECT * FROM users WHERE id = ANY(%s)", ([1, 2, 3, 42],)),
+    "loader.posts_by_author": ("SELECT * FROM posts WHERE author_id = ANY(%s) ORDER BY id", ([1, 2, 3, 42],)),
+    "loader.comments_by_post": ("SELECT * FROM comments WHERE post_id = ANY(%s) ORDER BY id", ([1, 2, 3, 42],)),
+    "loader.comments_by_author": ("SELECT * FROM comments WHERE author_id = ANY(%s) ORDER BY id", ([1, 2, 3, 42],)),
+    "loader.orders_by_user": ("SELECT * FROM orders WHERE user_id = ANY(%s) ORDER BY id", ([1, 2, 3, 42],)),
+}
+
+# Tables small enough (or queries unbounded by design) that a scan is expected
+SEQ_SCAN_ALLOWED = {"products"}
+
+def plan_nodes(node):
+    yield node
+    for child in node.get("Plans", []):
+        yield from plan_nodes(child)
+
+def explain(cur, sql, params):
+    cur.execute(f"EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) {sql}", params)
+    return cur.fetchone()[0][0]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--database-url", default=DATABASE_URL)
+    parser.add_argument("--seed", type=int, metavar="SCALE", help="seed SCALE x sample data first")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed cost growth over baseline")
+    parser.add_argument("--update-baseline", action="store_true")
+    args = parser.parse_args()
+
+    baseline = {}
+    if os.path.exists(BASELINE_FILE) and not args.update_baseline:
+        with open(BASELINE_FILE) as f:
+            baseline = json.load(f)
+
+    failures = []
+    costs = {}
+    with psycopg.connect(args.database_url) as conn:
+        if args.seed:
+            seed(conn, args.seed)
+        with conn.cursor() as cur:
+            for name, (sql, params) in QUERIES.items():
+                result = explain(cur, sql, params)
+                plan = result["Plan"]
+                costs[name] = plan["Total Cost"]
+                shared_hit = plan.get("Shared Hit Blocks", 0)
+                shared_read = plan.get("Shared Read Blocks", 0)
+                print(
+                    f"{name:36} cost={plan['Total Cost']:>10.2f} time={result['Execution Time']:>8.3f}ms "
+                    f"rows={plan['Actual Rows']:>6} buffers hit={shared_hit} read={shared_read}"
+                )
+                for node in plan_nodes(plan):
+                    if node["Node Type"] == "Seq Scan" and node["Relation Name"] not in SEQ_SCAN_ALLOWED:
+                        failures.append(f"{name}: sequential scan on {node['Relation Name']}")
+                if name in baseline and plan["Total Cost"] > baseline[name] * (1 + args.tolerance):
+                    failures.append(f"{name}: cost {plan['Total Cost']:.2f} exceeds baseline {baseline[name]:.2f}")
+        conn.rollback()
+
+    if args.update_baseline:
+        with open(BASELINE_FILE, "w") as f:
+            json.dump(costs, f, indent=2, sort_keys=True)
+        print(f"Baseline written to {BASELINE_FILE}")
+
+    for failure in failures:
+        print(f"FAIL {failure}")
+    sys.exit(1 if failures else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""Disposable Postgres and API server processes for the load test"""
+import os
+import sys
+import time
+import shutil
+import socket
+import tempfile
+import subprocess
+import urllib.request
+from contextlib import contextmanager
+from pathlib import Path
+import psycopg
+from psycopg.conninfo import make_conninfo
+
+API_DIR = Path(__file__).resolve().parents[2]
+INIT_SQL = API_DIR.parent / "init.sql"
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+@contextmanager
+def temporary_cluster(pg_bin=None):
+    """A fresh cluster in a temporary directory, removed on exit. Yields the
+    URL of its maintenance database."""
+    def tool(name):
+        return str(Path(pg_bin) / name) if pg_bin else name
+
+    directory = tempfile.mkdtemp(prefix="bench-pg-")
+    data = os.path.join(directory, "data")
+    port = free_port()
+    subprocess.run(
+        [tool("initdb"), "-D", data, "-U", "admin", "--auth=trust", "-E", "UTF8"],
+        check=True, stdout=subprocess.DEVNULL,
+    )
+    options = f"-p {port} -k {directory} -c listen_addresses=127.0.0.1 -c max_connections=200"
+    subprocess.run(
+        [tool("pg_ctl"), "-D", data, "-l", os.path.join(directory, "postgres.log"), "-o", options, "-w", "start"],
+        check=True, stdout=subprocess.DEVNULL,
+    )
+    try:
+        yield f"postgresql://admin@127.0.0.1:{port}/postgres"
+    finally:
+        subprocess.run([tool("pg_ctl"), "-D", data, "-m", "fast", "-w", "stop"], stdout=subprocess.DEVNULL)
+        shutil.rmtree(directory, ignore_errors=True)
+
+@contextmanager
+def disposable_database(server_url, keep=False):
+    """Create a database with the init.sql schema and sample data, dropped on
+    exit unless `keep`. Yields its URL."""
+    name = f"bench_{int(time.time())}_{os.getpid()}"
+    with psycopg.connect(server_url, autocommit=True) as admin:
+        admin.execute(f"CREATE DATABASE {name}")
+    url = make_conninfo(server_url, dbname=name)
+    try:
+        with psycopg.connect(url) as conn:
+            conn.execute(INIT_SQL.read_text())  # Simple protocol: runs the whole script
+        yield url
+    finally:
+        if keep:
+            print(f"Kept database {name}", file=sys.stderr)
+        else:
+            with psycopg.connect(server_url, autocommit=True) as admin:
+                admin.execute(f"DROP DATABASE IF EXISTS {name} WITH (FORCE)")
+
+def wait_until_healthy(port, process, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"API server exited with status {process.returncode}")
+        try:
+            with urllib.request.urlopen(f"http://127.0.0.1:{port}/health", timeout=1) as response:
+                if response.status == 200:
+                    return
+        except OSError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"API server not healthy after {timeout}s")
+
+@contextmanager
+def api_server(database_url, server="uvicorn", workers=None, env=None):
+    """Run the API on a free local port against `database_url`. `server` is
+    "uvicorn" (one process, as docker-compose.yml) or "gunicorn" (the
+    production profile). Yields the port."""
+    port = free_port()
+    environ = {**os.environ, "DATABASE_URL": database_url, "BIND": f"127.0.0.1:{port}", **(env or {})}
+    environ.pop("DATABASE_REPLICA_URL", None)
+    if workers:
+        environ["WEB_CONCURRENCY"] = str(workers)
+    if server == "gunicorn":
+        command = [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "main:app"]
+    else:
+        command = [
+            sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port),
+            "--no-access-log", "--log-level", "warning",
+        ]
+    # Access logs go to stdout; errors still reach stderr
+    process = subprocess.Popen(command, cwd=API_DIR, env=environ, stdout=subprocess.DEVNULL)
+    try:
+        wait_until_healthy(port, process)
+        yield port
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            process.kill()
@@ -0,0 +1,104 @@
+"""Fixed-concurrency replay and latency statistics"""
+import json
+import time
+import asyncio
+from collections import defaultdict
+
+class Connection:
+    """Minimal keep-alive HTTP/1.1 client, so that the load generator costs
+    far less per request than the server it measures"""
+
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+        self.reader = self.writer = None
+
+    async def post(self, path, payload):
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        body = json.dumps(payload).encode()
+        self.writer.write(
+            f"POST {path} HTTP/1.1\r\nHost: {self.host}\r\nContent-Type: application/json\r\n"
+            f"Accept: application/json, multipart/mixed\r\nContent-Length: {len(body)}\r\n\r\n".encode() + body
+        )
+        status = int((await self.reader.readline()).split()[1])
+        headers = {}
+        while (line := await self.reader.readline()) != b"\r\n":
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+        if "content-length" in headers:
+            content = await self.reader.readexactly(int(headers["content-length"]))
+        else:  # Chunked: the multipart responses of /graphql/stream
+            chunks = []
+            while size := int((await self.reader.readline()).split(b";")[0], 16):
+                chunks.append(await self.reader.readexactly(size))
+                await self.reader.readline()
+            await self.reader.readline()
+            content = b"".join(chunks)
+        if headers.get("connection") == "close":
+            self.close()
+        return status, headers.get("content-type", ""), content
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            self.reader = self.writer = None
+
+def failed(status, content_type, content):
+    if status != 200:
+        return True
+    if content_type.startswith("application/json"):
+        return "errors" in json.loads(content)
+    return b'"errors"' in content
+
+async def replay(port, workload, concurrency, duration, warmup=0):
+    """Run `concurrency` clients back to back for `warmup` + `duration`
+    seconds; returns per-operation latencies (seconds) and error counts
+    measured after the warmup"""
+    latencies = defaultdict(list)
+    errors = defaultdict(int)
+    started = time.perf_counter()
+    measure_from = started + warmup
+    stop_at = measure_from + duration
+
+    async def client():
+        connection = Connection("127.0.0.1", port)
+        try:
+            while (now := time.perf_counter()) < stop_at:
+                name, path, body = workload.next()
+                try:
+                    response = await connection.post(path, body)
+                    error = failed(*response)
+                except (OSError, asyncio.IncompleteReadError, ValueError, IndexError):
+                    connection.close()
+                    error = True
+                if now >= measure_from:
+                    latencies[name].append(time.perf_counter() - now)
+                    errors[name] += error
+        finally:
+            connection.close()
+
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    return latencies, errors, time.perf_counter() - measure_from
+
+def percentile(ordered, fraction):
+    """Nearest-rank percentile of a sorted list"""
+    return ordered[max(0, min(len(ordered) - 1, int(fraction * len(ordered) + 0.5) - 1))]
+
+def summarize(samples, errors, elapsed):
+    ordered = sorted(samples)
+    return {
+        "requests": len(ordered),
+        "errors": errors,
+        "rps": round(len(ordered) / elapsed, 1),
+        "mean_ms": round(sum(ordered) / len(ordered) * 1000, 2),
+        "p50_ms": round(percentile(ordered, 0.50) * 1000, 2),
+        "p95_ms": round(percentile(ordered, 0.95) * 1000, 2),
+        "p99_ms": round(percentile(ordered, 0.99) * 1000, 2),
+        "max_ms": round(ordered[-1] * 1000, 2),
+    }
+
+def report(latencies, errors, elapsed):
+    operations = {name: summarize(latencies[name], errors[name], elapsed) for name in sorted(latencies)}
+    everything = [latency for samples in latencies.values() for latency in samples]
+    return operations, summarize(everything, sum(errors.values()), elapsed) if everything else None
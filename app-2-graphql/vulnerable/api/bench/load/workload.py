@@ -0,0 +1,82 @@
+"""The operation mix, read from the frontend so the two stay in sync"""
+import re
+import random
+from pathlib import Path
+from bench.load.fixture import API_DIR
+
+APP_JS = API_DIR.parent / "frontend" / "app.js"
+
+# Each frontend function builds one document in a template literal
+FUNCTION_DOCUMENT = re.compile(
+    r"function (\w+)\([^)]*\)\s*\{(?:(?!\bfunction ).)*?const (?:query|mutation) = `(.*?)`", re.S
+)
+
+# Frontend function -> (relative weight, variables). Variables are drawn
+# from the seeded id ranges (`ids` maps table -> max id). Reads only by
+# default: the list fields return whole tables, so they are weighted low.
+READS = {
+    "fetchUser": (15, lambda r, ids: {"id": r.randint(1, ids["users"])}),
+    "fetchPost": (15, lambda r, ids: {"id": r.randint(1, ids["posts"])}),
+    "fetchProduct": (15, lambda r, ids: {"id": r.randint(1, ids["products"])}),
+    "fetchOrder": (5, lambda r, ids: {"id": r.randint(1, ids["orders"])}),
+    "fetchComments": (10, lambda r, ids: {"postId": r.randint(1, ids["posts"])}),
+    "fetchMessages": (8, lambda r, ids: {"userId": r.randint(1, ids["users"])}),
+    "fetchUserOrders": (5, lambda r, ids: {"userId": r.randint(1, ids["users"])}),
+    "fetchPostsByAuthor": (5, lambda r, ids: {"authorId": r.randint(1, ids["users"])}),
+    "searchUsers": (4, lambda r, ids: {"query": f"user{r.randint(1, ids['users'])}"}),
+    "typeaheadUsers": (8, lambda r, ids: {"prefix": f"user{r.randint(1, 99)}"}),
+    "fetchAllUsers": (2, lambda r, ids: {}),
+    "fetchAllProducts": (2, lambda r, ids: {}),
+    "fetchAllOrders": (1, lambda r, ids: {}),
+    "fetchAllPosts": (1, lambda r, ids: {}),
+    "streamAllPosts": (1, lambda r, ids: {}),
+}
+
+# Added with --writes
+WRITES = {
+    "createPost": (1, lambda r, ids: {
+        "title": "Load test", "content": "Load test post", "authorId": r.randint(1, ids["users"]),
+        "isPublished": True, "isPrivate": False,
+    }),
+    "createComment": (2, lambda r, ids: {
+        "content": "Load test", "postId": r.randint(1, ids["posts"]), "authorId": r.randint(1, ids["users"]),
+    }),
+    "createOrder": (2, lambda r, ids: {
+        "userId": r.randint(1, ids["users"]), "productId": r.randint(1, ids["products"]), "quantity": 1,
+    }),
+    "updateOrderStatus": (1, lambda r, ids: {"id": r.randint(1, ids["orders"]), "status": "shipped"}),
+    "sendMessage": (2, lambda r, ids: {
+        "fromUserId": r.randint(1, ids["users"]), "toUserId": r.randint(1, ids["users"]), "content": "Load test",
+    }),
+    "markMessageRead": (1, lambda r, ids: {"id": r.randint(1, ids["messages"])}),
+}
+
+# Sent to /graphql/stream (multipart) instead of /graphql
+STREAMED = {"streamAllPosts"}
+
+def frontend_documents(path=APP_JS):
+    return {name: document.strip() for name, document in FUNCTION_DOCUMENT.findall(Path(path).read_text())}
+
+class Workload:
+    """Draws (operation, path, body) from the weighted mix"""
+
+    def __init__(self, ids, writes=False, only=None, seed=0, app_js=APP_JS):
+        documents = frontend_documents(app_js)
+        mix = {**READS, **(WRITES if writes or only else {})}
+        if only:
+            mix = {name: mix[name] for name in only}
+        missing = sorted(set(mix) - set(documents))
+        if missing:
+            raise SystemExit(f"Not found in {app_js}: {', '.join(missing)}")
+        self.ids = ids
+        self.names = list(mix)
+        self.weights = [mix[name][0] for name in self.names]
+        self.variables = {name: mix[name][1] for name in self.names}
+        self.documents = {name: documents[name] for name in self.names}
+        self.random = random.Random(seed)
+
+    def next(self):
+        name = self.random.choices(self.names, self.weights)[0]
+        path = "/graphql/stream" if name in STREAMED else "/graphql"
+        body = {"query": self.documents[name], "variables": self.variables[name](self.random, self.ids)}
+        return name, path, body
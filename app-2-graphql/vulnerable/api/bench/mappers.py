@@ -0,0 +1,60 @@
+"""Row mapping throughput: dict rows vs tuple row mappers.
+
+Fetches product-shaped rows (DECIMAL price, TIMESTAMP created_at) generated
+server-side, and builds Product objects the previous way (dict_row, copied
+dict, str()/float() per row, keyword construction) and through
+mappers.mapped_cursor. Reports rows/sec for fetch plus mapping, and checks
+that both paths produce equal objects.
+
+    python -m bench.mappers --rows 50000 --repeat 5
+"""
+import argparse
+import time
+import psycopg
+from psycopg.rows import dict_row
+from bench.seed import DATABASE_URL
+
+ROWS_SQL = """
+SELECT g AS id, 'Product ' || g AS name, 'Generated product ' || g AS description,
+       (5 + g %% 500)::numeric(10, 2) AS price, g %% 1000 AS stock, true AS is_available,
+       timestamp '2024-01-15 10:30:00.123456' - (g || ' seconds')::interval AS created_at
+FROM generate_series(1, %s) g
+"""
+
+def legacy(conn, rows):
+    from main import Product
+    cur = conn.cursor(row_factory=dict_row)
+    cur.execute(ROWS_SQL, (rows,))
+    return [Product(**{**r, 'created_at': str(r['created_at']), 'price': float(r['price'])}) for r in cur.fetchall()]
+
+def mapped(conn, rows):
+    from main import Product
+    from mappers import mapped_cursor
+    cur = mapped_cursor(conn, Product)
+    cur.execute(ROWS_SQL, (rows,))
+    return cur.fetchall()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--database-url", default=DATABASE_URL)
+    parser.add_argument("--rows", type=int, default=50000)
+    parser.add_argument("--repeat", type=int, default=5, help="runs per path, best is reported")
+    args = parser.parse_args()
+
+    with psycopg.connect(args.database_url) as conn:
+        first = {}
+        for name, fetch in (("legacy", legacy), ("mapped", mapped)):
+            best = float("inf")
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                objects = fetch(conn, args.rows)
+                best = min(best, time.perf_counter() - start)
+            first[name] = objects[0]
+            print(f"{name:>8}: {args.rows / best:12.0f} rows/s  ({best * 1000:.1f} ms for {args.rows} rows)")
+        conn.rollback()
+
+    if first["legacy"] != first["mapped"]:
+        raise SystemExit(f"Mapped rows differ:\n  {first['legacy']}\n  {first['mapped']}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""Concurrent order placement against one contended SKU.
+
+Compares the previous read-price-then-insert path with the atomic
+statement in orders.py, reporting orders/sec and oversold units.
+
+    python -m bench.order_contention --concurrency 50 --stock 1000 --orders 2000
+"""
+import argparse
+import asyncio
+import os
+import time
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--stock", type=int, default=1000, help="units available on the SKU")
+    parser.add_argument("--orders", type=int, default=2000, help="orders of one unit to attempt")
+    parser.add_argument("--user-id", type=int, default=1)
+    return parser.parse_args()
+
+async def legacy_order(user_id, product_id, quantity):
+    """create_order before stock reservation: two round trips, no locking"""
+    from db import get_db_connection
+    async with get_db_connection() as conn:
+        cur = conn.cursor()
+        await cur.execute("SELECT price FROM products WHERE id = %s", (product_id,))
+        price = float((await cur.fetchone())[0])
+        await cur.execute(
+            "INSERT INTO orders (user_id, product_id, quantity, total_price) VALUES (%s, %s, %s, %s) RETURNING id",
+            (user_id, product_id, quantity, price * quantity)
+        )
+        order_id = (await cur.fetchone())[0]
+        await conn.commit()
+    return order_id, None
+
+async def run(name, place, args):
+    from db import get_db_connection
+    async with get_db_connection() as conn:
+        cur = conn.cursor()
+        await cur.execute(
+            "INSERT INTO products (name, price, stock) VALUES ('Benchmark SKU', 10.00, %s) RETURNING id",
+            (args.stock,)
+        )
+        product_id = (await cur.fetchone())[0]
+
+    remaining = args.orders
+    placed = rejected = 0
+
+    async def worker():
+        nonlocal remaining, placed, rejected
+        while remaining > 0:
+            remaining -= 1
+            order_id, error = await place(args.user_id, product_id, 1)
+            if order_id:
+                placed += 1
+            else:
+                rejected += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+    elapsed = time.perf_counter() - start
+
+    async with get_db_connection() as conn:
+        cur = conn.cursor()
+        await cur.execute("SELECT COALESCE(SUM(quantity), 0) FROM orders WHERE product_id = %s", (product_id,))
+        ordered = (await cur.fetchone())[0]
+        await cur.execute("DELETE FROM products WHERE id = %s", (product_id,))  # Cascades to the orders
+
+    print(
+        f"{name:>8}: {args.orders / elapsed:8.1f} attempts/s  {placed / elapsed:8.1f} orders/s  "
+        f"placed={placed} rejected={rejected} oversold={max(0, ordered - args.stock)}"
+    )
+
+async def main():
+    args = parse_args()
+    os.environ.setdefault("DB_POOL_MIN_SIZE", str(args.concurrency))
+    os.environ.setdefault("DB_POOL_MAX_SIZE", str(args.concurrency))
+    from db import open_pool, close_pool
+    from orders import place_order
+
+    await open_pool()
+    try:
+        print(f"{args.orders} single-unit orders, {args.stock} in stock, concurrency {args.concurrency}")
+        await run("legacy", legacy_order, args)
+        await run("atomic", place_order, args)
+    finally:
+        await close_pool()
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,91 @@
+"""Scalable synthetic data on top of the init.sql sample data.
+
+`--scale N` inserts N times the sample row counts per table (5 users,
+5 posts, 4 comments, 5 products, 5 orders, 5 messages), generated
+server-side with generate_series.
+
+    python -m bench.seed --scale 20000
+"""
+import argparse
+import os
+import psycopg
+
+DATABASE_URL = os.environ.get("DATABASE_URL", "postgresql://admin:password123@db:5432/graphql_db")
+
+# Rows per table per unit of scale, mirroring init.sql
+SAMPLE_ROWS = {"users": 5, "posts": 5, "comments": 4, "products": 5, "orders": 5, "messages": 5}
+
+# Foreign keys are drawn uniformly from the existing id range; the seed is
+# fixed so that repeated runs produce comparable datasets.
+SEED_SQL = [
+    """
+    INSERT INTO users (username, email, password, role, salary, ssn, created_at)
+    SELECT 'user' || g || '_' || %(run)s, 'user' || g || '_' || %(run)s || '@example.com', 'password' || g,
+           (ARRAY['user', 'user', 'user', 'moderator', 'admin'])[1 + g %% 5],
+           30000 + (g %% 120000), lpad((g %% 1000000000)::text, 9, '0'),
+           now() - (g || ' seconds')::interval
+    FROM generate_series(1, %(users)s) g
+    """,
+    """
+    INSERT INTO posts (title, content, author_id, is_published, is_private, created_at)
+    SELECT 'Post ' || g, repeat('Lorem ipsum dolor sit amet. ', 1 + g %% 20),
+           1 + floor(random() * (SELECT max(id) FROM users))::int,
+           g %% 3 <> 0, g %% 7 = 0, now() - (g || ' seconds')::interval
+    FROM generate_series(1, %(posts)s) g
+    """,
+    """
+    INSERT INTO comments (content, post_id, author_id, created_at)
+    SELECT 'Comment ' || g,
+           1 + floor(random() * (SELECT max(id) FROM posts))::int,
+           1 + floor(random() * (SELECT max(id) FROM users))::int,
+           now() - (g || ' seconds')::interval
+    FROM generate_series(1, %(comments)s) g
+    """,
+    """
+    INSERT INTO products (name, description, price, stock, created_at)
+    SELECT 'Product ' || g, 'Generated product ' || g, 5 + (g %% 500), g %% 1000,
+           now() - (g || ' seconds')::interval
+    FROM generate_series(1, %(products)s) g
+    """,
+    """
+    INSERT INTO orders (user_id, product_id, quantity, total_price, status, created_at)
+    SELECT 1 + floor(random() * (SELECT max(id) FROM users))::int,
+           1 + floor(random() * (SELECT max(id) FROM products))::int,
+           1 + g %% 5, 10 * (1 + g %% 5), (ARRAY['pending', 'completed', 'shipped'])[1 + g %% 3],
+           now() - (g || ' seconds')::interval
+    FROM generate_series(1, %(orders)s) g
+    """,
+    """
+    INSERT INTO messages (from_user_id, to_user_id, content, created_at)
+    SELECT 1 + floor(random() * (SELECT max(id) FROM users))::int,
+           1 + floor(random() * (SELECT max(id) FROM users))::int,
+           'Message ' || g, now() - (g || ' seconds')::interval
+    FROM generate_series(1, %(messages)s) g
+    """,
+]
+
+def seed(conn, scale):
+    """Insert `scale` times the sample data and refresh planner statistics"""
+    params = {table: rows * scale for table, rows in SAMPLE_ROWS.items()}
+    with conn.cursor() as cur:
+        cur.execute("SELECT count(*) FROM users")
+        params["run"] = cur.fetchone()[0]  # Keeps usernames unique across runs
+        cur.execute("SELECT setseed(0.42)")
+        for sql in SEED_SQL:
+            cur.execute(sql, params)
+        cur.execute("ANALYZE")
+    conn.commit()
+    return params
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scale", type=int, default=20000)
+    parser.add_argument("--database-url", default=DATABASE_URL)
+    args = parser.parse_args()
+    with psycopg.connect(args.database_url) as conn:
+        counts = seed(conn, args.scale)
+    counts.pop("run")
+    print("Inserted " + ", ".join(f"{rows} {table}" for table, rows in counts.items()))
+
+if __name__ == "__main__":
+    main()
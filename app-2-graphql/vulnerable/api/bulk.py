@@ -0,0 +1,54 @@
+import os
+import psycopg
+from db import get_db_connection
+
+# Batches at least this large are loaded with COPY FROM STDIN
+BULK_COPY_THRESHOLD = int(os.environ.get("BULK_COPY_THRESHOLD", "1000"))
+
+async def insert_rows(conn, table, columns, rows):
+    """Insert rows and return their ids in input order. Ids are reserved from
+    the table's sequence up front, so COPY (which cannot RETURNING) still maps
+    every item to its id."""
+    cur = conn.cursor()
+    await cur.execute(
+        "SELECT nextval(pg_get_serial_sequence(%s, 'id')) FROM generate_series(1, %s)",
+        (table, len(rows))
+    )
+    ids = [r[0] for r in await cur.fetchall()]
+    column_list = ", ".join(["id", *columns])
+    if len(rows) >= BULK_COPY_THRESHOLD:
+        async with cur.copy(f"COPY {table} ({column_list}) FROM STDIN") as copy:
+            for id, row in zip(ids, rows):
+                await copy.write_row((id, *row))
+    else:
+        placeholders = ", ".join(["%s"] * (len(columns) + 1))
+        await cur.executemany(
+            f"INSERT INTO {table} ({column_list}) VALUES ({placeholders})",
+            [(id, *row) for id, row in zip(ids, rows)]
+        )
+    return ids
+
+async def insert_batch(table, columns, rows):
+    """Insert a batch in one transaction, returning (index, id, error) per row.
+
+    The whole batch is tried first in one go; if it fails, the
+    rows are retried one savepoint each so valid rows are still committed and
+    each failure is reported against its own item."""
+    results = []
+    if not rows:
+        return results
+    async with get_db_connection() as conn:
+        async with conn.transaction():
+            try:
+                async with conn.transaction():
+                    ids = await insert_rows(conn, table, columns, rows)
+                results = [(index, id, None) for index, id in enumerate(ids)]
+            except psycopg.Error:
+                for index, row in enumerate(rows):
+                    try:
+                        async with conn.transaction():
+                            ids = await insert_rows(conn, table, columns, [row])
+                        results.append((index, ids[0], None))
+                    except psycopg.Error as e:
+                        results.append((index, None, str(e)))
+    return results
@@ -0,0 +1,115 @@
+import os
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict, defaultdict
+from db import read_only
+
+RESULT_CACHE_SIZE = int(os.environ.get("RESULT_CACHE_SIZE", "10000"))
+RESULT_CACHE_TTL = float(os.environ.get("RESULT_CACHE_TTL", "30"))
+
+MISSING = object()
+
+class CacheBackend(ABC):
+    """Storage for cached resolver results. Async so that a networked,
+    Redis-compatible store can implement the same three methods."""
+
+    @abstractmethod
+    async def get(self, key):
+        """Return the stored value or MISSING"""
+
+    @abstractmethod
+    async def set(self, key, value, ttl, tags=()):
+        """Store the value for `ttl` seconds, findable by each of the tags"""
+
+    @abstractmethod
+    async def invalidate(self, *tags):
+        """Drop every key stored under any of the tags"""
+
+class InMemoryCache(CacheBackend):
+    """Per-process LRU with TTLs and a tag -> keys index"""
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()  # key -> (expires_at, value, tags)
+        self.tags = defaultdict(set)
+
+    def _drop(self, key):
+        _, _, tags = self.entries.pop(key)
+        for tag in tags:
+            keys = self.tags[tag]
+            keys.discard(key)
+            if not keys:
+                del self.tags[tag]
+
+    async def get(self, key):
+        entry = self.entries.get(key)
+        if entry is None:
+            return MISSING
+        if entry[0] < time.monotonic():
+            self._drop(key)
+            return MISSING
+        self.entries.move_to_end(key)
+        return entry[1]
+
+    async def set(self, key, value, ttl, tags=()):
+        if key in self.entries:
+            self._drop(key)
+        self.entries[key] = (time.monotonic() + ttl, value, tuple(tags))
+        for tag in tags:
+            self.tags[tag].add(key)
+        if len(self.entries) > self.maxsize:
+            self._drop(next(iter(self.entries)))
+
+    async def invalidate(self, *tags):
+        for tag in tags:
+            for key in list(self.tags.get(tag, ())):
+                self._drop(key)
+
+class ResultCache:
+    """Resolver result cache with per-field hit/miss accounting"""
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.hits = defaultdict(int)
+        self.misses = defaultdict(int)
+        # Invalidations so far, and the number reached at each tag's last one
+        self.generation = 0
+        self.invalidated = {}
+
+    async def fetch(self, field, key, tags, compute, ttl=RESULT_CACHE_TTL):
+        """Return the cached value for key, or compute and store it under tags
+        (a list, or a function of the computed value returning one)"""
+        value = await self.backend.get(key)
+        if value is not MISSING:
+            self.hits[field] += 1
+            return value
+        self.misses[field] += 1
+        generation = self.generation
+        # Filled from the primary: a lagging replica read right after an
+        # invalidation would otherwise be cached for the whole TTL
+        token = read_only.set(False)
+        try:
+            value = await compute()
+        finally:
+            read_only.reset(token)
+        tags = tags(value) if callable(tags) else tags
+        # Not stored when one of its tags was invalidated while computing:
+        # the value may predate the write
+        if not any(self.invalidated.get(tag, 0) > generation for tag in tags):
+            await self.backend.set(key, value, ttl, tags)
+        return value
+
+    async def invalidate(self, *tags):
+        self.generation += 1
+        for tag in tags:
+            self.invalidated[tag] = self.generation
+        await self.backend.invalidate(*tags)
+
+    def stats(self):
+        report = {}
+        for field in set(self.hits) | set(self.misses):
+            hits, misses = self.hits[field], self.misses[field]
+            report[field] = {"hits": hits, "misses": misses, "hit_ratio": hits / (hits + misses)}
+        return report
+
+result_cache = ResultCache(InMemoryCache(RESULT_CACHE_SIZE))
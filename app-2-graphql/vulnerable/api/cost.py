@@ -0,0 +1,173 @@
+import os
+from graphql import (
+    FieldNode,
+    FragmentDefinitionNode,
+    FragmentSpreadNode,
+    GraphQLError,
+    InlineFragmentNode,
+    get_named_type,
+    get_nullable_type,
+    is_composite_type,
+    is_list_type,
+)
+from graphql.execution import ExecutionResult
+from graphql.execution.values import get_argument_values, get_variable_values
+from graphql.utilities import get_operation_ast
+from strawberry.extensions import SchemaExtension
+
+# Cost budget per operation; 0 disables enforcement and only reports the cost
+# VULN: Enforcement is off by default, expensive queries are accepted
+MAX_QUERY_COST = int(os.environ.get("MAX_QUERY_COST", "0"))
+
+# Assumed size of a list field that has no limit/first argument
+DEFAULT_LIST_SIZE = 100
+
+# Weight of each field, keyed by "Type.fieldName"; composite fields default to
+# 1 and scalars to 0. Root fields hit the database directly, relationship
+# fields go through a batched DataLoader.
+FIELD_WEIGHTS = {
+    "Query.user": 5,
+    "Query.users": 10,
+    "Query.userByUsername": 5,
+    "Query.post": 5,
+    "Query.posts": 10,
+    "Query.comments": 10,
+    "Query.product": 5,
+    "Query.products": 10,
+    "Query.order": 5,
+    "Query.orders": 10,
+    "Query.messages": 10,
+    "Query.searchUsers": 20,
+    "Query.userTypeahead": 5,
+    "Query.usersConnection": 5,
+    "Query.postsConnection": 5,
+    "Query.productsConnection": 5,
+    "Query.ordersConnection": 5,
+    "Query.messagesConnection": 5,
+    "User.posts": 2,
+    "User.comments": 2,
+    "User.orders": 2,
+    "Post.author": 2,
+    "Post.comments": 2,
+    "Comment.author": 2,
+    "Comment.post": 2,
+    "Order.user": 2,
+    "Order.product": 2,
+    "Message.sender": 2,
+    "Message.recipient": 2,
+}
+
+# Mutations write to the database and are always weighted
+MUTATION_WEIGHT = 10
+
+def page_size(args):
+    """Value of a `first`/`limit` argument, None without one"""
+    for name in ("first", "limit"):
+        if args.get(name) is not None:
+            return max(args[name], 0)
+    return None
+
+def list_size(parent_type, field_name, field_def, args, page=None):
+    """Number of times a field's selection set is resolved; `page` is the
+    `first` of the connection when `parent_type` is one"""
+    if parent_type.name.endswith("Connection"):
+        if field_name == "edges":
+            return DEFAULT_LIST_SIZE if page is None else page
+        return 1  # pageInfo: one object whatever the page size
+    if get_named_type(field_def.type).name.endswith("Connection"):
+        return 1  # Sized through its edges
+    size = page_size(args)
+    if size is not None:
+        return size
+    if is_list_type(get_nullable_type(field_def.type)):
+        return DEFAULT_LIST_SIZE
+    return 1
+
+def input_items(field_def, args):
+    """Items in the list arguments of a field (e.g. a batch mutation's
+    `input`), at least 1"""
+    items = 0
+    for name, value in args.items():
+        if value is not None and is_list_type(get_nullable_type(field_def.args[name].type)):
+            items += len(value)
+    return max(items, 1)
+
+def selection_cost(schema, parent_type, selection_set, fragments, variables, page=None):
+    cost = 0
+    for selection in selection_set.selections:
+        if isinstance(selection, FieldNode):
+            name = selection.name.value
+            if name.startswith("__"):
+                continue
+            field_def = parent_type.fields[name]
+            key = f"{parent_type.name}.{name}"
+            args = get_argument_values(field_def, selection, variables)
+            if parent_type is schema.mutation_type:
+                # Batch mutations write one row per input item
+                weight = FIELD_WEIGHTS.get(key, MUTATION_WEIGHT) * input_items(field_def, args)
+            else:
+                weight = FIELD_WEIGHTS.get(key, 1 if is_composite_type(get_named_type(field_def.type)) else 0)
+            cost += weight
+            if selection.selection_set:
+                size = list_size(parent_type, name, field_def, args, page)
+                child_type = get_named_type(field_def.type)
+                # Every resolved object costs 1 on top of its own selection
+                child_cost = selection_cost(
+                    schema, child_type, selection.selection_set, fragments, variables, page_size(args)
+                )
+                cost += size * (1 + child_cost)
+        elif isinstance(selection, InlineFragmentNode):
+            fragment_type = parent_type
+            if selection.type_condition:
+                fragment_type = schema.get_type(selection.type_condition.name.value)
+            cost += selection_cost(schema, fragment_type, selection.selection_set, fragments, variables, page)
+        elif isinstance(selection, FragmentSpreadNode):
+            fragment = fragments[selection.name.value]
+            fragment_type = schema.get_type(fragment.type_condition.name.value)
+            cost += selection_cost(schema, fragment_type, fragment.selection_set, fragments, variables, page)
+    return cost
+
+def operation_cost(schema, document, operation_name=None, variables=None):
+    """Static cost of an operation: field weights plus objects returned, multiplied by list sizes.
+    None when `variables` do not match the operation's variable definitions;
+    execution reports those errors."""
+    operation = get_operation_ast(document, operation_name)
+    if operation is None:
+        return 0
+    coerced = get_variable_values(schema, operation.variable_definitions or [], variables or {})
+    if isinstance(coerced, list):
+        return None
+    fragments = {
+        definition.name.value: definition
+        for definition in document.definitions
+        if isinstance(definition, FragmentDefinitionNode)
+    }
+    root_type = schema.get_root_type(operation.operation)
+    return selection_cost(schema, root_type, operation.selection_set, fragments, coerced)
+
+def execution_cost(exe):
+    """Cost of the operation of an ExecutionContext, whose variables are already coerced"""
+    root_type = exe.schema.get_root_type(exe.operation.operation)
+    return selection_cost(exe.schema, root_type, exe.operation.selection_set, exe.fragments, exe.variable_values)
+
+class QueryCost(SchemaExtension):
+    """Computes the cost of each operation before execution, rejects it when
+    over MAX_QUERY_COST and reports it in the response `extensions`"""
+
+    cost = None
+
+    def on_execute(self):
+        ctx = self.execution_context
+        self.cost = operation_cost(ctx.schema._schema, ctx.graphql_document, ctx.operation_name, ctx.variables)
+        if self.cost is not None and MAX_QUERY_COST and self.cost > MAX_QUERY_COST:
+            error = GraphQLError(
+                f"Query cost {self.cost} exceeds the maximum of {MAX_QUERY_COST}",
+                extensions={"code": "QUERY_TOO_EXPENSIVE"},
+            )
+            ctx.result = ExecutionResult(data=None, errors=[error])
+        yield
+
+    def get_results(self):
+        if self.cost is None:
+            return {}
+        return {"cost": {"requested": self.cost, "maximum": MAX_QUERY_COST or None}}
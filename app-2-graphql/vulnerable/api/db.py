@@ -0,0 +1,129 @@
+import os
+import asyncio
+import contextlib
+from contextvars import ContextVar
+import psycopg
+from psycopg_pool import AsyncConnectionPool
+from strawberry.extensions import SchemaExtension
+from strawberry.types.graphql import OperationType
+from tracing import configure_connection, timed_connection
+
+# Database connection
+DATABASE_URL = os.environ.get("DATABASE_URL", "postgresql://admin:password123@db:5432/graphql_db")
+# Optional streaming replica for read-only operations
+DATABASE_REPLICA_URL = os.environ.get("DATABASE_REPLICA_URL")
+
+# Pool sizing, tuned through the environment (per worker process)
+DB_POOL_MIN_SIZE = int(os.environ.get("DB_POOL_MIN_SIZE", "2"))
+DB_POOL_MAX_SIZE = int(os.environ.get("DB_POOL_MAX_SIZE", "10"))
+DB_POOL_TIMEOUT = float(os.environ.get("DB_POOL_TIMEOUT", "30"))
+
+# Reads fall back to the primary while the replica is further behind than
+# this many seconds, or when its lag cannot be measured
+REPLICA_MAX_LAG = float(os.environ.get("REPLICA_MAX_LAG", "1"))
+REPLICA_LAG_CHECK_INTERVAL = float(os.environ.get("REPLICA_LAG_CHECK_INTERVAL", "1"))
+
+# Zero when the replica has replayed everything it received, so an idle
+# primary does not look like lag
+REPLICA_LAG_SQL = """
+SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+            ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) END
+"""
+
+def create_pool(url):
+    return AsyncConnectionPool(
+        url,
+        min_size=DB_POOL_MIN_SIZE,
+        max_size=DB_POOL_MAX_SIZE,
+        timeout=DB_POOL_TIMEOUT,
+        check=AsyncConnectionPool.check_connection,  # Health check before each checkout
+        configure=configure_connection,  # Timed cursors (see tracing.py)
+        open=False,
+    )
+
+# Shared connection pools, opened and closed by the FastAPI lifespan
+pool = create_pool(DATABASE_URL)
+replica_pool = create_pool(DATABASE_REPLICA_URL) if DATABASE_REPLICA_URL else None
+
+# True while a read-only operation executes (set by ReadReplicaRouting)
+read_only = ContextVar("read_only", default=False)
+
+class ReplicaMonitor:
+    """Polls the replica's replay lag; reads use the replica only while it is fresh"""
+
+    def __init__(self):
+        self.lag = None  # Seconds, None until measured or while unreachable
+        self.task = None
+        self.replica_reads = 0
+        self.primary_fallbacks = 0
+
+    def usable(self):
+        return self.lag is not None and self.lag <= REPLICA_MAX_LAG
+
+    async def run(self):
+        while True:
+            try:
+                async with replica_pool.connection() as conn:
+                    cur = await conn.execute(REPLICA_LAG_SQL)
+                    self.lag = float((await cur.fetchone())[0] or 0)
+            except psycopg.Error:
+                self.lag = None
+            await asyncio.sleep(REPLICA_LAG_CHECK_INTERVAL)
+
+    def stats(self):
+        return {
+            "lag_seconds": self.lag,
+            "max_lag_seconds": REPLICA_MAX_LAG,
+            "in_use": self.usable(),
+            "replica_reads": self.replica_reads,
+            "primary_fallbacks": self.primary_fallbacks,
+        }
+
+replica = ReplicaMonitor()
+
+def get_db_connection():
+    """Borrow a pooled connection: `async with get_db_connection() as conn`.
+    Read-only operations get a replica connection while the replica is fresh."""
+    if replica_pool is not None and read_only.get():
+        if replica.usable():
+            replica.replica_reads += 1
+            return timed_connection(replica_pool.connection(), "replica")
+        replica.primary_fallbacks += 1
+    return timed_connection(pool.connection(), "primary")
+
+class ReadReplicaRouting(SchemaExtension):
+    """Routes query operations to the replica; mutations and subscriptions
+    stay on the primary"""
+
+    def on_execute(self):
+        token = read_only.set(self.execution_context.operation_type == OperationType.QUERY)
+        yield
+        read_only.reset(token)
+
+async def open_pool():
+    await pool.open()
+    if replica_pool is not None:
+        await replica_pool.open()
+        replica.task = asyncio.create_task(replica.run())
+
+async def close_pool():
+    if replica_pool is not None:
+        replica.task.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await replica.task
+        await replica_pool.close()
+    await pool.close()
+
+def stats_of(connection_pool):
+    """Pool counters: checkouts (requests_num), wait time (requests_wait_ms), sizes"""
+    stats = connection_pool.get_stats()
+    stats["requests_wait_avg_ms"] = (
+        stats.get("requests_wait_ms", 0) / stats["requests_num"] if stats.get("requests_num") else 0
+    )
+    return stats
+
+def pool_stats():
+    stats = stats_of(pool)
+    if replica_pool is not None:
+        stats["replica"] = {**stats_of(replica_pool), **replica.stats()}
+    return stats
@@ -0,0 +1,41 @@
+# Production profile: gunicorn -c gunicorn.conf.py main:app
+#
+# The app is imported once in the master (preload) and forked into the
+# workers, which share its memory copy-on-write. Pools, the LISTEN connection
+# and the replica monitor are only opened in each worker's lifespan.
+#
+# kill -HUP <master>   restart workers gracefully (same code)
+# kill -USR2 <master>  start a new master with new code, then TERM the old one
+import os
+import multiprocessing
+
+bind = os.environ.get("BIND", "0.0.0.0:8000")
+# One async worker per core; each worker opens its own DB pools
+workers = int(os.environ.get("WEB_CONCURRENCY", multiprocessing.cpu_count()))
+worker_class = "workers.ProductionWorker"
+preload_app = True
+
+# Requests in flight get this long to finish on restart or shutdown
+graceful_timeout = int(os.environ.get("GRACEFUL_TIMEOUT", "30"))
+timeout = int(os.environ.get("WORKER_TIMEOUT", "60"))
+keepalive = 5
+
+# Recycle workers now and then, staggered so they do not restart together
+max_requests = int(os.environ.get("MAX_REQUESTS", "10000"))
+max_requests_jitter = max_requests // 10
+
+accesslog = "-"
+
+# With PROMETHEUS_MULTIPROC_DIR set, workers write their metrics to files in
+# it and /metrics sums them: start empty, drop dead workers' gauges
+def on_starting(server):
+    directory = os.environ.get("PROMETHEUS_MULTIPROC_DIR")
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+        for name in os.listdir(directory):
+            os.remove(os.path.join(directory, name))
+
+def child_exit(server, worker):
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid)
@@ -0,0 +1,31 @@
+from collections import defaultdict
+from strawberry.dataloader import DataLoader
+from db import get_db_connection
+from mappers import mapped_cursor
+
+# Batch loaders: every key requested at one depth of the query is collapsed
+# into a single `WHERE column = ANY(%s)` statement.
+
+async def fetch_rows(sql, keys, cls):
+    async with get_db_connection() as conn:
+        cur = mapped_cursor(conn, cls)
+        await cur.execute(sql, (list(keys),))
+        return await cur.fetchall()
+
+def by_id(table, cls):
+    """Loader returning one object (or None) per id"""
+    async def load(keys):
+        objects = await fetch_rows(f"SELECT * FROM {table} WHERE id = ANY(%s)", keys, cls)
+        found = {o.id: o for o in objects}
+        return [found.get(key) for key in keys]
+    return DataLoader(load_fn=load)
+
+def grouped_by(table, column, cls):
+    """Loader returning the list of rows whose `column` matches each key"""
+    async def load(keys):
+        objects = await fetch_rows(f"SELECT * FROM {table} WHERE {column} = ANY(%s) ORDER BY id", keys, cls)
+        groups = defaultdict(list)
+        for o in objects:
+            groups[getattr(o, column)].append(o)
+        return [groups[key] for key in keys]
+    return DataLoader(load_fn=load)
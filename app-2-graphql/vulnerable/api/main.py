@@ -1,23 +1,34 @@
-import os
+import re
 import strawberry
-from strawberry.fastapi import GraphQLRouter
-from fastapi import FastAPI
+from fastapi import FastAPI, Response
 from fastapi.middleware.cors import CORSMiddleware
-from typing import Optional, List
-import psycopg2
-from psycopg2.extras import RealDictCursor
-from datetime import datetime
-from decimal import Decimal
+from strawberry.types import Info
+from typing import AsyncGenerator, Optional, List
+from contextlib import aclosing, asynccontextmanager
+from db import get_db_connection, open_pool, close_pool, pool_stats, ReadReplicaRouting
+from loaders import by_id, grouped_by
+from pagination import Connection, fetch_page
+from cost import QueryCost
+from persisted import DocumentCacheExtension, PersistedQueryRouter, documents
+from cache import result_cache
+from bulk import insert_batch
+from orders import place_order
+from mappers import mapped_cursor
+from stream import stream, defer, stream_endpoint
+from notify import notifications
+from tracing import ResolverTracing, render_metrics
+from prometheus_client import CONTENT_TYPE_LATEST
 
-# Database connection
-DATABASE_URL = os.environ.get("DATABASE_URL", "postgresql://admin:password123@db:5432/graphql_db")
+# Search limits
+MAX_SEARCH_RESULTS = 100
+TYPEAHEAD_MIN_LENGTH = 2
+TYPEAHEAD_CACHE_TTL = 10
 
-def get_db_connection():
-    return psycopg2.connect(DATABASE_URL)
-
-# Strawberry types
+# Strawberry types. Row-backed types are slotted and built by mappers.py
+# straight from tuple rows.
 @strawberry.type
 class User:
+    __slots__ = ("id", "username", "email", "password", "role", "is_active", "salary", "ssn", "created_at")
     id: int
     username: str
     email: str
@@ -28,8 +39,22 @@ class User:
     ssn: Optional[str]  # VULN: Exposing SSN
     created_at: str
 
+    @strawberry.field
+    async def posts(self, info: Info) -> List["Post"]:
+        return await info.context["loaders"]["posts_by_author"].load(self.id)
+
+    @strawberry.field
+    async def comments(self, info: Info) -> List["Comment"]:
+        return await info.context["loaders"]["comments_by_author"].load(self.id)
+
+    @strawberry.field
+    async def orders(self, info: Info) -> List["Order"]:
+        """VULN: Exposes every order of the user"""
+        return await info.context["loaders"]["orders_by_user"].load(self.id)
+
 @strawberry.type
 class Post:
+    __slots__ = ("id", "title", "content", "author_id", "is_published", "is_private", "created_at")
     id: int
     title: str
     content: str
@@ -38,16 +63,34 @@ class Post:
     is_private: bool  # VULN: Private flag exposed
     created_at: str
 
+    @strawberry.field
+    async def author(self, info: Info) -> Optional[User]:
+        return await info.context["loaders"]["user"].load(self.author_id)
+
+    @strawberry.field
+    async def comments(self, info: Info) -> List["Comment"]:
+        return await info.context["loaders"]["comments_by_post"].load(self.id)
+
 @strawberry.type
 class Comment:
+    __slots__ = ("id", "content", "post_id", "author_id", "created_at")
     id: int
     content: str
     post_id: int
     author_id: int
     created_at: str
 
+    @strawberry.field
+    async def author(self, info: Info) -> Optional[User]:
+        return await info.context["loaders"]["user"].load(self.author_id)
+
+    @strawberry.field
+    async def post(self, info: Info) -> Optional[Post]:
+        return await info.context["loaders"]["post"].load(self.post_id)
+
 @strawberry.type
 class Product:
+    __slots__ = ("id", "name", "description", "price", "stock", "is_available", "created_at")
     id: int
     name: str
     description: Optional[str]
@@ -58,6 +101,7 @@ class Product:
 
 @strawberry.type
 class Order:
+    __slots__ = ("id", "user_id", "product_id", "quantity", "total_price", "status", "created_at")
     id: int
     user_id: int
     product_id: int
@@ -66,8 +110,17 @@ class Order:
     status: str
     created_at: str
 
+    @strawberry.field
+    async def user(self, info: Info) -> Optional[User]:
+        return await info.context["loaders"]["user"].load(self.user_id)
+
+    @strawberry.field
+    async def product(self, info: Info) -> Optional[Product]:
+        return await info.context["loaders"]["product"].load(self.product_id)
+
 @strawberry.type
 class Message:
+    __slots__ = ("id", "from_user_id", "to_user_id", "content", "is_read", "created_at")
     id: int
     from_user_id: int
     to_user_id: int
@@ -75,180 +128,301 @@ class Message:
     is_read: bool
     created_at: str
 
+    @strawberry.field
+    async def sender(self, info: Info) -> Optional[User]:
+        return await info.context["loaders"]["user"].load(self.from_user_id)
+
+    @strawberry.field
+    async def recipient(self, info: Info) -> Optional[User]:
+        return await info.context["loaders"]["user"].load(self.to_user_id)
+
 @strawberry.type
 class SuccessResponse:
     success: bool
     message: str
     id: Optional[int] = None
 
+@strawberry.type
+class BatchItemResult:
+    index: int
+    success: bool
+    message: str
+    id: Optional[int] = None
+
+@strawberry.type
+class BatchResponse:
+    success: bool
+    inserted: int
+    results: List[BatchItemResult]
+
+# Batch inputs
+@strawberry.input
+class UserInput:
+    username: str
+    email: str
+    password: str
+    role: Optional[str] = "user"  # VULN: Mass assignment of role
+    salary: Optional[float] = None
+    ssn: Optional[str] = None
+
+@strawberry.input
+class PostInput:
+    title: str
+    content: str
+    author_id: int
+    is_published: bool = False
+    is_private: bool = False
+
+@strawberry.input
+class CommentInput:
+    content: str
+    post_id: int
+    author_id: int
+
+@strawberry.input
+class MessageInput:
+    from_user_id: int
+    to_user_id: int
+    content: str
+
+def batch_response(results):
+    items = [
+        BatchItemResult(index=index, success=error is None, message=error or "Created", id=id)
+        for index, id, error in results
+    ]
+    inserted = sum(item.success for item in items)
+    return BatchResponse(success=inserted == len(items), inserted=inserted, results=items)
+
+def create_loaders():
+    """Fresh DataLoaders per request so batches and caches never leak between requests"""
+    return {
+        "user": by_id("users", User),
+        "post": by_id("posts", Post),
+        "product": by_id("products", Product),
+        "posts_by_author": grouped_by("posts", "author_id", Post),
+        "comments_by_post": grouped_by("comments", "post_id", Comment),
+        "comments_by_author": grouped_by("comments", "author_id", Comment),
+        "orders_by_user": grouped_by("orders", "user_id", Order),
+    }
+
+async def get_context():
+    return {"loaders": create_loaders()}
+
+# Statements behind the list fields, shared by their resolvers and by
+# /graphql/stream which reads them from a server-side cursor
+def posts_statement(author_id=None):
+    if author_id:
+        return "SELECT * FROM posts WHERE author_id = %s", (author_id,)
+    return "SELECT * FROM posts", ()
+
+def orders_statement(user_id=None):
+    if user_id:
+        return "SELECT * FROM orders WHERE user_id = %s", (user_id,)
+    return "SELECT * FROM orders", ()
+
+def messages_statement(user_id):
+    # UNION ALL lets each branch use its own index instead of an OR scan
+    return (
+        "SELECT * FROM messages WHERE from_user_id = %s "
+        "UNION ALL "
+        "SELECT * FROM messages WHERE to_user_id = %s AND from_user_id IS DISTINCT FROM %s",
+        (user_id, user_id, user_id)
+    )
+
 # Queries
 @strawberry.type
 class Query:
     # VULN: No authentication checks on any queries
     # VULN: No query depth limiting
-    # VULN: No query complexity limiting
-    
+    # VULN: Query cost is only enforced when MAX_QUERY_COST is set
+
     @strawberry.field
-    def user(self, id: int) -> Optional[User]:
+    async def user(self, id: int) -> Optional[User]:
         """Get user by ID - VULN: No authorization check"""
-        conn = get_db_connection()
-        cur = conn.cursor(cursor_factory=RealDictCursor)
-        cur.execute("SELECT * FROM users WHERE id = %s", (id,))
-        result = cur.fetchone()
-        cur.close()
-        conn.close()
-        if result:
-            result['created_at'] = str(result['created_at'])
-            return User(**result)
-        return None
-    
+        async with get_db_connection() as conn:
+            cur = mapped_cursor(conn, User)
+            await cur.execute("SELECT * FROM users WHERE id = %s", (id,))
+            return await cur.fetchone()
+
     @strawberry.field
-    def users(self, limit: Optional[int] = 100) -> List[User]:
+    async def users(self, limit: Optional[int] = 100) -> List[User]:
         """Get all users - VULN: No pagination limits, returns sensitive data"""
-        conn = get_db_connection()
-        cur = conn.cursor(cursor_factory=RealDictCursor)
-        cur.execute(f"SELECT * FROM users LIMIT {limit}")  # VULN: SQL injection via limit
-        results = cur.fetchall()
-        cur.close()
-        conn.close()
-        return [User(**{**r, 'created_at': str(r['created_at'])}) for r in results]
-    
+        async with get_db_connection() as conn:
+            cur = mapped_cursor(conn, User)
+            await cur.execute(f"SELECT * FROM users LIMIT {limit}")  # VULN: SQL injection via limit
+            return await cur.fetchall()
+
     @strawberry.field
-    def user_by_username(self, username: str) -> Optional[User]:
+    async def user_by_username(self, username: str) -> Optional[User]:
         """Search user by username - VULN: SQL injection"""
-        conn = get_db_connection()
-        cur = conn.cursor(cursor_factory=RealDictCursor)
-        # VULN: Direct string interpolation leads to SQL injection
-        query = f"SELECT * FROM users WHERE username = '{username}'"
-        cur.execute(query)
-        result = cur.fetchone()
-        cur.close()
-        conn.close()
-        if result:
-            result['created_at'] = str(result['created_at'])
-            return User(**result)
-        return None
-    
+        async with get_db_connection() as conn:
+            cur = mapped_cursor(conn, User)
+            # VULN: Direct string interpolation leads to SQL injection
+            query = f"SELECT * FROM users WHERE username = '{username}'"
+            await cur.execute(query)
+            return await cur.fetchone()
+
     @strawberry.field
-    def post(self, id: int) -> Optional[Post]:
+    async def post(self, id: int) -> Optional[Post]:
         """Get post by ID - VULN: Returns private posts without auth check"""
-        conn = get_db_connection()
-        cur = conn.cursor(cursor_factory=RealDictCursor)
-        cur.execute("SELECT * FROM posts WHERE id = %s", (id,))
-        result = cur.fetchone()
-        cur.close()
-        conn.close()
-        if result:
-            result['created_at'] = str(result['created_at'])
-            return Post(**result)
-        return None
-    
+        async def load():
+            async with get_db_connection() as conn:
+                cur = mapped_cursor(conn, Post)
+                await cur.execute("SELECT * FROM posts WHERE id = %s", (id,))
+                return await cur.fetchone()
+
+        def tags(post):
+            return [f"post:{id}"] + ([f"user:{post.author_id}"] if post else [])
+
+        return await result_cache.fetch("Query.post", f"post:{id}", tags, load)
+
     @strawberry.field
-    def posts(self, author_id: Optional[int] = None) -> List[Post]:
+    async def posts(self, author_id: Optional[int] = None) -> List[Post]:
         """Get all posts - VULN: Returns unpublished and private posts"""
-        conn = get_db_connection()
-        cur = conn.cursor(cursor_factory=RealDictCursor)
-        if author_id:
-            cur.execute("SELECT * FROM posts WHERE author_id = %s", (author_id,))
-        else:
-            cur.execute("SELECT * FROM posts")
-        results = cur.fetchall()
-        cur.close()
-        conn.close()
-        return [Post(**{**r, 'created_at': str(r['created_at'])}) for r in results]
-    
+        async def load():
+            async with get_db_connection() as conn:
+                cur = mapped_cursor(conn, Post)
+                await cur.execute(*posts_statement(author_id))
+                return await cur.fetchall()
+
+        return await result_cache.fetch("Query.posts", f"posts:author={author_id}", ["posts"], load)
+
     @strawberry.field
-    def comments(self, post_id: int) -> List[Comment]:
+    async def comments(self, post_id: int) -> List[Comment]:
         """Get comments for a post"""
-        conn = get_db_connection()
-        cur = conn.cursor(cursor_factory=RealDictCursor)
-        cur.execute("SELECT * FROM comments WHERE post_id = %s", (post_id,))
-        results = cur.fetchall()
-        cur.close()
-        conn.close()
-        return [Comment(**{**r, 'created_at': str(r['created_at'])}) for r in results]
-    
+        async with get_db_connection() as conn:
+            cur = mapped_cursor(conn, Comment)
+            await cur.execute("SELECT * FROM comments WHERE post_id = %s", (post_id,))
+            return await cur.fetchall()
+
     @strawberry.field
-    def product(self, id: int) -> Optional[Product]:
+    async def product(self, id: int) -> Optional[Product]:
         """Get product by ID"""
-        conn = get_db_connection()
-        cur = conn.cursor(cursor_factory=RealDictCursor)
-        cur.execute("SELECT * FROM products WHERE id = %s", (id,))
-        result = cur.fetchone()
-        cur.close()
-        conn.close()
-        if result:
-            result['created_at'] = str(result['created_at'])
-            result['price'] = float(result['price'])
-            return Product(**result)
-        return None
-    
+        async def load():
+            async with get_db_connection() as conn:
+                cur = mapped_cursor(conn, Product)
+                await cur.execute("SELECT * FROM products WHERE id = %s", (id,))
+                return await cur.fetchone()
+
+        return await result_cache.fetch("Query.product", f"product:{id}", [f"product:{id}"], load)
+
     @strawberry.field
-    def products(self) -> List[Product]:
+    async def products(self) -> List[Product]:
         """Get all products"""
-        conn = get_db_connection()
-        cur = conn.cursor(cursor_factory=RealDictCursor)
-        cur.execute("SELECT * FROM products")
-        results = cur.fetchall()
-        cur.close()
-        conn.close()
-        return [Product(**{**r, 'created_at': str(r['created_at']), 'price': float(r['price'])}) for r in results]
-    
+        async def load():
+            async with get_db_connection() as conn:
+                cur = mapped_cursor(conn, Product)
+                await cur.execute("SELECT * FROM products")
+                return await cur.fetchall()
+
+        return await result_cache.fetch("Query.products", "products", ["products"], load)
+
     @strawberry.field
-    def order(self, id: int) -> Optional[Order]:
+    async def order(self, id: int) -> Optional[Order]:
         """Get order by ID - VULN: No authorization, can view any user's orders"""
-        conn = get_db_connection()
-        cur = conn.cursor(cursor_factory=RealDictCursor)
-        cur.execute("SELECT * FROM orders WHERE id = %s", (id,))
-        result = cur.fetchone()
-        cur.close()
-        conn.close()
-        if result:
-            result['created_at'] = str(result['created_at'])
-            result['total_price'] = float(result['total_price'])
-            return Order(**result)
-        return None
-    
+        async with get_db_connection() as conn:
+            cur = mapped_cursor(conn, Order)
+            await cur.execute("SELECT * FROM orders WHERE id = %s", (id,))
+            return await cur.fetchone()
+
     @strawberry.field
-    def orders(self, user_id: Optional[int] = None) -> List[Order]:
+    async def orders(self, user_id: Optional[int] = None) -> List[Order]:
         """Get orders - VULN: Can query any user's orders without auth"""
-        conn = get_db_connection()
-        cur = conn.cursor(cursor_factory=RealDictCursor)
-        if user_id:
-            cur.execute("SELECT * FROM orders WHERE user_id = %s", (user_id,))
-        else:
-            cur.execute("SELECT * FROM orders")
-        results = cur.fetchall()
-        cur.close()
-        conn.close()
-        return [Order(**{**r, 'created_at': str(r['created_at']), 'total_price': float(r['total_price'])}) for r in results]
-    
+        async with get_db_connection() as conn:
+            cur = mapped_cursor(conn, Order)
+            await cur.execute(*orders_statement(user_id))
+            return await cur.fetchall()
+
     @strawberry.field
-    def messages(self, user_id: int) -> List[Message]:
+    async def messages(self, user_id: int) -> List[Message]:
         """Get messages for user - VULN: Can read any user's messages"""
-        conn = get_db_connection()
-        cur = conn.cursor(cursor_factory=RealDictCursor)
-        cur.execute(
-            "SELECT * FROM messages WHERE from_user_id = %s OR to_user_id = %s",
-            (user_id, user_id)
+        async with get_db_connection() as conn:
+            cur = mapped_cursor(conn, Message)
+            await cur.execute(*messages_statement(user_id))
+            return await cur.fetchall()
+
+    @strawberry.field
+    async def search_users(self, query: str, limit: int = 20, offset: int = 0) -> List[User]:
+        """Ranked full-text search over username and email - VULN: SQL injection vulnerability"""
+        limit = max(0, min(limit, MAX_SEARCH_RESULTS))
+        async with get_db_connection() as conn:
+            cur = mapped_cursor(conn, User)
+            # VULN: SQL injection through the search term
+            sql = (
+                f"SELECT users.* FROM user_search JOIN users ON users.id = user_search.user_id, "
+                f"plainto_tsquery('simple', '{query}') AS q "
+                f"WHERE user_search.document @@ q "
+                f"ORDER BY ts_rank(user_search.document, q) DESC, users.id "
+                f"LIMIT {limit} OFFSET {max(0, offset)}"
+            )
+            await cur.execute(sql)
+            return await cur.fetchall()
+
+    @strawberry.field
+    async def user_typeahead(self, prefix: str, limit: int = 10) -> List[User]:
+        """Prefix search for per-keystroke lookups - VULN: returns sensitive data"""
+        words = re.findall(r"\w+", prefix.lower())
+        if len(prefix.strip()) < TYPEAHEAD_MIN_LENGTH or not words:
+            return []
+        tsquery = " & ".join(f"{word}:*" for word in words)
+        limit = max(0, min(limit, MAX_SEARCH_RESULTS))
+
+        async def load():
+            async with get_db_connection() as conn:
+                cur = mapped_cursor(conn, User)
+                # Parameterized so psycopg prepares it server-side after a few keystrokes
+                await cur.execute(
+                    "SELECT users.* FROM user_search JOIN users ON users.id = user_search.user_id "
+                    "WHERE user_search.document @@ to_tsquery('simple', %s) "
+                    "ORDER BY length(users.username), users.id LIMIT %s",
+                    (tsquery, limit)
+                )
+                return await cur.fetchall()
+
+        return await result_cache.fetch(
+            "Query.userTypeahead", f"typeahead:{tsquery}:{limit}", ["users"], load, ttl=TYPEAHEAD_CACHE_TTL
         )
-        results = cur.fetchall()
-        cur.close()
-        conn.close()
-        return [Message(**{**r, 'created_at': str(r['created_at'])}) for r in results]
-    
+
+    # Cursor-paginated connections: keyset on (created_at, id)
+
+    @strawberry.field
+    async def users_connection(self, first: int = 50, after: Optional[str] = None) -> Connection[User]:
+        """Page through users - VULN: returns sensitive data"""
+        return await fetch_page("users", User, first, after)
+
+    @strawberry.field
+    async def posts_connection(
+        self, first: int = 50, after: Optional[str] = None, author_id: Optional[int] = None
+    ) -> Connection[Post]:
+        """Page through posts - VULN: includes unpublished and private posts"""
+        if author_id:
+            return await fetch_page("posts", Post, first, after, "author_id = %s", (author_id,))
+        return await fetch_page("posts", Post, first, after)
+
     @strawberry.field
-    def search_users(self, query: str) -> List[User]:
-        """Search users - VULN: SQL injection vulnerability"""
-        conn = get_db_connection()
-        cur = conn.cursor(cursor_factory=RealDictCursor)
-        # VULN: SQL injection through LIKE clause
-        sql = f"SELECT * FROM users WHERE username LIKE '%{query}%' OR email LIKE '%{query}%'"
-        cur.execute(sql)
-        results = cur.fetchall()
-        cur.close()
-        conn.close()
-        return [User(**{**r, 'created_at': str(r['created_at'])}) for r in results]
+    async def products_connection(self, first: int = 50, after: Optional[str] = None) -> Connection[Product]:
+        """Page through products"""
+        return await fetch_page("products", Product, first, after)
+
+    @strawberry.field
+    async def orders_connection(
+        self, first: int = 50, after: Optional[str] = None, user_id: Optional[int] = None
+    ) -> Connection[Order]:
+        """Page through orders - VULN: any user's orders without auth"""
+        if user_id:
+            return await fetch_page("orders", Order, first, after, "user_id = %s", (user_id,))
+        return await fetch_page("orders", Order, first, after)
+
+    @strawberry.field
+    async def messages_connection(
+        self, user_id: int, first: int = 50, after: Optional[str] = None
+    ) -> Connection[Message]:
+        """Page through a user's messages - VULN: any user's messages"""
+        # Sent and received messages, as in messages_statement
+        return await fetch_page("messages", Message, first, after, branches=[
+            ("from_user_id = %s", (user_id,)),
+            ("to_user_id = %s AND from_user_id IS DISTINCT FROM %s", (user_id, user_id)),
+        ])
 
 # Mutations
 @strawberry.type
@@ -256,9 +430,9 @@ class Mutation:
     # VULN: No authentication or authorization on mutations
     # VULN: No rate limiting
     # VULN: Mass assignment vulnerabilities
-    
+
     @strawberry.mutation
-    def create_user(
+    async def create_user(
         self,
         username: str,
         email: str,
@@ -268,26 +442,23 @@ class Mutation:
         ssn: Optional[str] = None
     ) -> SuccessResponse:
         """Create user - VULN: Allows setting role, salary, SSN without restrictions"""
-        conn = get_db_connection()
-        cur = conn.cursor()
-        try:
-            cur.execute(
-                "INSERT INTO users (username, email, password, role, salary, ssn) VALUES (%s, %s, %s, %s, %s, %s) RETURNING id",
-                (username, email, password, role, salary, ssn)
-            )
-            user_id = cur.fetchone()[0]
-            conn.commit()
-            cur.close()
-            conn.close()
-            return SuccessResponse(success=True, message="User created", id=user_id)
-        except Exception as e:
-            conn.rollback()
-            cur.close()
-            conn.close()
-            return SuccessResponse(success=False, message=str(e))
-    
+        async with get_db_connection() as conn:
+            cur = conn.cursor()
+            try:
+                await cur.execute(
+                    "INSERT INTO users (username, email, password, role, salary, ssn) VALUES (%s, %s, %s, %s, %s, %s) RETURNING id",
+                    (username, email, password, role, salary, ssn)
+                )
+                user_id = (await cur.fetchone())[0]
+                await conn.commit()
+                await result_cache.invalidate("users")
+                return SuccessResponse(success=True, message="User created", id=user_id)
+            except Exception as e:
+                await conn.rollback()
+                return SuccessResponse(success=False, message=str(e))
+
     @strawberry.mutation
-    def update_user(
+    async def update_user(
         self,
         id: int,
         username: Optional[str] = None,
@@ -298,11 +469,9 @@ class Mutation:
         salary: Optional[float] = None
     ) -> SuccessResponse:
         """Update user - VULN: Can update any user without auth, including role escalation"""
-        conn = get_db_connection()
-        cur = conn.cursor()
         updates = []
         values = []
-        
+
         if username:
             updates.append("username = %s")
             values.append(username)
@@ -321,44 +490,40 @@ class Mutation:
         if salary is not None:
             updates.append("salary = %s")
             values.append(salary)
-        
+
         if not updates:
             return SuccessResponse(success=False, message="No fields to update")
-        
+
         values.append(id)
         query = f"UPDATE users SET {', '.join(updates)} WHERE id = %s"
-        
-        try:
-            cur.execute(query, values)
-            conn.commit()
-            cur.close()
-            conn.close()
-            return SuccessResponse(success=True, message="User updated")
-        except Exception as e:
-            conn.rollback()
-            cur.close()
-            conn.close()
-            return SuccessResponse(success=False, message=str(e))
-    
+
+        async with get_db_connection() as conn:
+            cur = conn.cursor()
+            try:
+                await cur.execute(query, values)
+                await conn.commit()
+                await result_cache.invalidate("users")
+                return SuccessResponse(success=True, message="User updated")
+            except Exception as e:
+                await conn.rollback()
+                return SuccessResponse(success=False, message=str(e))
+
     @strawberry.mutation
-    def delete_user(self, id: int) -> SuccessResponse:
+    async def delete_user(self, id: int) -> SuccessResponse:
         """Delete user - VULN: Can delete any user without authorization"""
-        conn = get_db_connection()
-        cur = conn.cursor()
-        try:
-            cur.execute("DELETE FROM users WHERE id = %s", (id,))
-            conn.commit()
-            cur.close()
-            conn.close()
-            return SuccessResponse(success=True, message="User deleted")
-        except Exception as e:
-            conn.rollback()
-            cur.close()
-            conn.close()
-            return SuccessResponse(success=False, message=str(e))
-    
+        async with get_db_connection() as conn:
+            cur = conn.cursor()
+            try:
+                await cur.execute("DELETE FROM users WHERE id = %s", (id,))
+                await conn.commit()
+                await result_cache.invalidate("users", "posts", f"user:{id}")  # Posts cascade with the user
+                return SuccessResponse(success=True, message="User deleted")
+            except Exception as e:
+                await conn.rollback()
+                return SuccessResponse(success=False, message=str(e))
+
     @strawberry.mutation
-    def create_post(
+    async def create_post(
         self,
         title: str,
         content: str,
@@ -367,26 +532,23 @@ class Mutation:
         is_private: bool = False
     ) -> SuccessResponse:
         """Create post - VULN: Can create post as any user"""
-        conn = get_db_connection()
-        cur = conn.cursor()
-        try:
-            cur.execute(
-                "INSERT INTO posts (title, content, author_id, is_published, is_private) VALUES (%s, %s, %s, %s, %s) RETURNING id",
-                (title, content, author_id, is_published, is_private)
-            )
-            post_id = cur.fetchone()[0]
-            conn.commit()
-            cur.close()
-            conn.close()
-            return SuccessResponse(success=True, message="Post created", id=post_id)
-        except Exception as e:
-            conn.rollback()
-            cur.close()
-            conn.close()
-            return SuccessResponse(success=False, message=str(e))
-    
+        async with get_db_connection() as conn:
+            cur = conn.cursor()
+            try:
+                await cur.execute(
+                    "INSERT INTO posts (title, content, author_id, is_published, is_private) VALUES (%s, %s, %s, %s, %s) RETURNING id",
+                    (title, content, author_id, is_published, is_private)
+                )
+                post_id = (await cur.fetchone())[0]
+                await conn.commit()
+                await result_cache.invalidate("posts", f"post:{post_id}")
+                return SuccessResponse(success=True, message="Post created", id=post_id)
+            except Exception as e:
+                await conn.rollback()
+                return SuccessResponse(success=False, message=str(e))
+
     @strawberry.mutation
-    def update_post(
+    async def update_post(
         self,
         id: int,
         title: Optional[str] = None,
@@ -395,11 +557,9 @@ class Mutation:
         is_private: Optional[bool] = None
     ) -> SuccessResponse:
         """Update post - VULN: Can update any post without ownership check"""
-        conn = get_db_connection()
-        cur = conn.cursor()
         updates = []
         values = []
-        
+
         if title:
             updates.append("title = %s")
             values.append(title)
@@ -412,158 +572,198 @@ class Mutation:
         if is_private is not None:
             updates.append("is_private = %s")
             values.append(is_private)
-        
+
         if not updates:
             return SuccessResponse(success=False, message="No fields to update")
-        
+
         values.append(id)
         query = f"UPDATE posts SET {', '.join(updates)} WHERE id = %s"
-        
-        try:
-            cur.execute(query, values)
-            conn.commit()
-            cur.close()
-            conn.close()
-            return SuccessResponse(success=True, message="Post updated")
-        except Exception as e:
-            conn.rollback()
-            cur.close()
-            conn.close()
-            return SuccessResponse(success=False, message=str(e))
-    
+
+        async with get_db_connection() as conn:
+            cur = conn.cursor()
+            try:
+                await cur.execute(query, values)
+                await conn.commit()
+                await result_cache.invalidate("posts", f"post:{id}")
+                return SuccessResponse(success=True, message="Post updated")
+            except Exception as e:
+                await conn.rollback()
+                return SuccessResponse(success=False, message=str(e))
+
     @strawberry.mutation
-    def delete_post(self, id: int) -> SuccessResponse:
+    async def delete_post(self, id: int) -> SuccessResponse:
         """Delete post - VULN: Can delete any post"""
-        conn = get_db_connection()
-        cur = conn.cursor()
-        try:
-            cur.execute("DELETE FROM posts WHERE id = %s", (id,))
-            conn.commit()
-            cur.close()
-            conn.close()
-            return SuccessResponse(success=True, message="Post deleted")
-        except Exception as e:
-            conn.rollback()
-            cur.close()
-            conn.close()
-            return SuccessResponse(success=False, message=str(e))
-    
+        async with get_db_connection() as conn:
+            cur = conn.cursor()
+            try:
+                await cur.execute("DELETE FROM posts WHERE id = %s", (id,))
+                await conn.commit()
+                await result_cache.invalidate("posts", f"post:{id}")
+                return SuccessResponse(success=True, message="Post deleted")
+            except Exception as e:
+                await conn.rollback()
+                return SuccessResponse(success=False, message=str(e))
+
     @strawberry.mutation
-    def create_comment(self, content: str, post_id: int, author_id: int) -> SuccessResponse:
+    async def create_comment(self, content: str, post_id: int, author_id: int) -> SuccessResponse:
         """Create comment"""
-        conn = get_db_connection()
-        cur = conn.cursor()
-        try:
-            cur.execute(
-                "INSERT INTO comments (content, post_id, author_id) VALUES (%s, %s, %s) RETURNING id",
-                (content, post_id, author_id)
-            )
-            comment_id = cur.fetchone()[0]
-            conn.commit()
-            cur.close()
-            conn.close()
-            return SuccessResponse(success=True, message="Comment created", id=comment_id)
-        except Exception as e:
-            conn.rollback()
-            cur.close()
-            conn.close()
-            return SuccessResponse(success=False, message=str(e))
-    
+        async with get_db_connection() as conn:
+            cur = conn.cursor()
+            try:
+                await cur.execute(
+                    "INSERT INTO comments (content, post_id, author_id) VALUES (%s, %s, %s) RETURNING id",
+                    (content, post_id, author_id)
+                )
+                comment_id = (await cur.fetchone())[0]
+                await conn.commit()
+                return SuccessResponse(success=True, message="Comment created", id=comment_id)
+            except Exception as e:
+                await conn.rollback()
+                return SuccessResponse(success=False, message=str(e))
+
     @strawberry.mutation
-    def create_order(
+    async def create_order(
         self,
         user_id: int,
         product_id: int,
         quantity: int
     ) -> SuccessResponse:
-        """Create order - VULN: Can create order for any user, no stock checking"""
-        conn = get_db_connection()
-        cur = conn.cursor()
+        """Create order - VULN: Can create order for any user, negative quantities accepted"""
         try:
-            # Get product price
-            cur.execute("SELECT price FROM products WHERE id = %s", (product_id,))
-            result = cur.fetchone()
-            if not result:
-                return SuccessResponse(success=False, message="Product not found")
-            
-            price = float(result[0])
-            total_price = price * quantity
-            
-            cur.execute(
-                "INSERT INTO orders (user_id, product_id, quantity, total_price) VALUES (%s, %s, %s, %s) RETURNING id",
-                (user_id, product_id, quantity, total_price)
-            )
-            order_id = cur.fetchone()[0]
-            conn.commit()
-            cur.close()
-            conn.close()
-            return SuccessResponse(success=True, message="Order created", id=order_id)
+            order_id, error = await place_order(user_id, product_id, quantity)
         except Exception as e:
-            conn.rollback()
-            cur.close()
-            conn.close()
             return SuccessResponse(success=False, message=str(e))
-    
+        if error:
+            return SuccessResponse(success=False, message=error)
+        await result_cache.invalidate(f"product:{product_id}", "products")  # Stock changed
+        return SuccessResponse(success=True, message="Order created", id=order_id)
+
     @strawberry.mutation
-    def update_order_status(self, id: int, status: str) -> SuccessResponse:
+    async def update_order_status(self, id: int, status: str) -> SuccessResponse:
         """Update order status - VULN: Can update any order status"""
-        conn = get_db_connection()
-        cur = conn.cursor()
-        try:
-            cur.execute("UPDATE orders SET status = %s WHERE id = %s", (status, id))
-            conn.commit()
-            cur.close()
-            conn.close()
-            return SuccessResponse(success=True, message="Order status updated")
-        except Exception as e:
-            conn.rollback()
-            cur.close()
-            conn.close()
-            return SuccessResponse(success=False, message=str(e))
-    
+        async with get_db_connection() as conn:
+            cur = conn.cursor()
+            try:
+                await cur.execute("UPDATE orders SET status = %s WHERE id = %s", (status, id))
+                await conn.commit()
+                return SuccessResponse(success=True, message="Order status updated")
+            except Exception as e:
+                await conn.rollback()
+                return SuccessResponse(success=False, message=str(e))
+
     @strawberry.mutation
-    def send_message(self, from_user_id: int, to_user_id: int, content: str) -> SuccessResponse:
+    async def send_message(self, from_user_id: int, to_user_id: int, content: str) -> SuccessResponse:
         """Send message - VULN: Can send message as any user"""
-        conn = get_db_connection()
-        cur = conn.cursor()
-        try:
-            cur.execute(
-                "INSERT INTO messages (from_user_id, to_user_id, content) VALUES (%s, %s, %s) RETURNING id",
-                (from_user_id, to_user_id, content)
-            )
-            message_id = cur.fetchone()[0]
-            conn.commit()
-            cur.close()
-            conn.close()
-            return SuccessResponse(success=True, message="Message sent", id=message_id)
-        except Exception as e:
-            conn.rollback()
-            cur.close()
-            conn.close()
-            return SuccessResponse(success=False, message=str(e))
-    
+        async with get_db_connection() as conn:
+            cur = conn.cursor()
+            try:
+                await cur.execute(
+                    "INSERT INTO messages (from_user_id, to_user_id, content) VALUES (%s, %s, %s) RETURNING id",
+                    (from_user_id, to_user_id, content)
+                )
+                message_id = (await cur.fetchone())[0]
+                await conn.commit()
+                return SuccessResponse(success=True, message="Message sent", id=message_id)
+            except Exception as e:
+                await conn.rollback()
+                return SuccessResponse(success=False, message=str(e))
+
     @strawberry.mutation
-    def mark_message_read(self, id: int) -> SuccessResponse:
+    async def mark_message_read(self, id: int) -> SuccessResponse:
         """Mark message as read"""
-        conn = get_db_connection()
-        cur = conn.cursor()
-        try:
-            cur.execute("UPDATE messages SET is_read = true WHERE id = %s", (id,))
-            conn.commit()
-            cur.close()
-            conn.close()
-            return SuccessResponse(success=True, message="Message marked as read")
-        except Exception as e:
-            conn.rollback()
-            cur.close()
-            conn.close()
-            return SuccessResponse(success=False, message=str(e))
+        async with get_db_connection() as conn:
+            cur = conn.cursor()
+            try:
+                await cur.execute("UPDATE messages SET is_read = true WHERE id = %s", (id,))
+                await conn.commit()
+                return SuccessResponse(success=True, message="Message marked as read")
+            except Exception as e:
+                await conn.rollback()
+                return SuccessResponse(success=False, message=str(e))
+
+    # Batch mutations: one transaction per call, COPY for large batches
+
+    @strawberry.mutation
+    async def create_users(self, input: List[UserInput]) -> BatchResponse:
+        """Create users in bulk - VULN: Same mass assignment as createUser"""
+        rows = [(u.username, u.email, u.password, u.role, u.salary, u.ssn) for u in input]
+        response = batch_response(await insert_batch(
+            "users", ["username", "email", "password", "role", "salary", "ssn"], rows
+        ))
+        await result_cache.invalidate("users")
+        return response
+
+    @strawberry.mutation
+    async def create_posts(self, input: List[PostInput]) -> BatchResponse:
+        """Create posts in bulk - VULN: Can create posts as any user"""
+        rows = [(p.title, p.content, p.author_id, p.is_published, p.is_private) for p in input]
+        response = batch_response(await insert_batch(
+            "posts", ["title", "content", "author_id", "is_published", "is_private"], rows
+        ))
+        await result_cache.invalidate("posts")
+        return response
+
+    @strawberry.mutation
+    async def create_comments(self, input: List[CommentInput]) -> BatchResponse:
+        """Create comments in bulk"""
+        rows = [(c.content, c.post_id, c.author_id) for c in input]
+        return batch_response(await insert_batch("comments", ["content", "post_id", "author_id"], rows))
+
+    @strawberry.mutation
+    async def send_messages(self, input: List[MessageInput]) -> BatchResponse:
+        """Send messages in bulk - VULN: Can send messages as any user"""
+        rows = [(m.from_user_id, m.to_user_id, m.content) for m in input]
+        return batch_response(await insert_batch("messages", ["from_user_id", "to_user_id", "content"], rows))
+
+# Subscriptions, over WebSocket on /graphql
+@strawberry.type
+class Subscription:
+    # VULN: No authentication, anyone can subscribe to any user's events
+
+    @strawberry.subscription
+    async def message_received(self, user_id: int) -> AsyncGenerator[Message, None]:
+        """Messages sent to a user as they arrive - VULN: Can read any user's messages"""
+        async with aclosing(notifications.subscribe("message_received", user_id)) as events:
+            async for event in events:
+                if "content" in event:
+                    yield Message(**event)
+                    continue
+                # Too long for a NOTIFY payload: read the message back
+                async with get_db_connection() as conn:
+                    cur = mapped_cursor(conn, Message)
+                    await cur.execute("SELECT * FROM messages WHERE id = %s", (event["id"],))
+                    message = await cur.fetchone()
+                if message:
+                    yield message
+
+    @strawberry.subscription
+    async def order_status_changed(self, user_id: Optional[int] = None) -> AsyncGenerator[Order, None]:
+        """Order status updates, for one user or everyone - VULN: Exposes every user's orders"""
+        async with aclosing(notifications.subscribe("order_status_changed", user_id)) as events:
+            async for event in events:
+                yield Order(**event)
 
 # Create schema
-schema = strawberry.Schema(query=Query, mutation=Mutation)
+schema = strawberry.Schema(
+    query=Query,
+    mutation=Mutation,
+    subscription=Subscription,
+    directives=[stream, defer],
+    extensions=[DocumentCacheExtension, QueryCost, ReadReplicaRouting, ResolverTracing],
+)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Open the shared connection pool and the LISTEN connection on startup,
+    # close both on shutdown
+    await open_pool()
+    notifications.start()
+    yield
+    await notifications.stop()
+    await close_pool()
 
 # Create FastAPI app
-app = FastAPI(title="Vulnerable GraphQL API", debug=True)
+app = FastAPI(title="Vulnerable GraphQL API", debug=True, lifespan=lifespan)
 
 # VULN: Overly permissive CORS
 app.add_middleware(
@@ -575,11 +775,23 @@ app.add_middleware(
 )
 
 # VULN: GraphiQL enabled in production with introspection
-graphql_app = GraphQLRouter(
+graphql_app = PersistedQueryRouter(
     schema,
+    context_getter=get_context,
     graphiql=True  # VULN: GraphiQL exposed in production
 )
 
+# Incremental delivery (@defer/@stream) as multipart/mixed
+app.add_api_route(
+    "/graphql/stream",
+    stream_endpoint(schema, get_context, {
+        "posts": (Post, posts_statement),
+        "orders": (Order, orders_statement),
+        "messages": (Message, messages_statement),
+    }),
+    methods=["POST"],
+)
+
 app.include_router(graphql_app, prefix="/graphql")
 
 @app.get("/")
@@ -587,10 +799,22 @@ def read_root():
     return {
         "message": "Vulnerable GraphQL API",
         "graphql_endpoint": "/graphql",
+        "stream_endpoint": "/graphql/stream",
+        "metrics": "/metrics",
         "graphiql": "/graphql (interactive playground)"
     }
 
 @app.get("/health")
 def health_check():
-    return {"status": "healthy"}
+    return {
+        "status": "healthy",
+        "db_pool": pool_stats(),
+        "documents": documents.stats(),
+        "result_cache": result_cache.stats(),
+        "subscriptions": notifications.stats(),
+    }
 
+@app.get("/metrics")
+def metrics():
+    # Prometheus scrape target: latency histograms per field and per statement
+    return Response(render_metrics(), headers={"Content-Type": CONTENT_TYPE_LATEST})
@@ -0,0 +1,60 @@
+from dataclasses import fields
+from psycopg import postgres
+from psycopg.pq import Format
+from psycopg.rows import no_result
+
+# Row mapping: tuple rows go straight into the (slotted) Strawberry types.
+# Column positions are matched to fields once per result shape, and type
+# conversion happens in psycopg's C loaders
+# while the result is parsed instead of per row in Python:
+#   TIMESTAMP -> the server's text form, e.g. '2024-01-15 10:30:00.123456',
+#                as str(datetime) produced before (the server drops trailing
+#                zeros of the fraction)
+#   DECIMAL   -> float
+TEXT_COLUMNS = ("timestamp", "timestamptz", "date")
+FLOAT_COLUMNS = ("numeric",)
+
+_mappers = {}
+
+def row_mapper(cls, columns):
+    """Return `values -> cls` for a result with these column names. Columns the
+    type does not declare are ignored; the function is cached per shape."""
+    positions = {}
+    for index, column in enumerate(columns):
+        positions.setdefault(column, index)
+    names = [f.name for f in fields(cls) if f.init]
+    missing = [name for name in names if name not in positions]
+    if missing:
+        raise ValueError(f"{cls.__name__} needs columns missing from the result: {', '.join(missing)}")
+    picked = tuple((name, positions[name]) for name in names)
+
+    key = (cls, picked, len(columns))
+    if key not in _mappers:
+        def make_row(values):
+            # Fields set directly: skips __init__ and its keyword handling
+            row = object.__new__(cls)
+            for name, index in picked:
+                setattr(row, name, values[index])
+            return row
+        _mappers[key] = make_row
+    return _mappers[key]
+
+def rows_of(cls):
+    """psycopg row factory producing `cls` instances"""
+    def factory(cursor):
+        if cursor.description is None:
+            return no_result
+        return row_mapper(cls, tuple(c.name for c in cursor.description))
+    return factory
+
+def mapped_cursor(conn, cls, **kwargs):
+    """Cursor on `conn` whose rows are `cls` instances, with API-ready values"""
+    cur = conn.cursor(row_factory=rows_of(cls), **kwargs)
+    adapters = cur.adapters
+    text = adapters.get_loader(postgres.types["text"].oid, Format.TEXT)
+    to_float = adapters.get_loader(postgres.types["float8"].oid, Format.TEXT)
+    for name in TEXT_COLUMNS:
+        adapters.register_loader(name, text)
+    for name in FLOAT_COLUMNS:
+        adapters.register_loader(name, to_float)
+    return cur
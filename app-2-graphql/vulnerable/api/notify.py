@@ -0,0 +1,112 @@
+import os
+import sys
+import json
+import asyncio
+import contextlib
+from collections import defaultdict
+import psycopg
+from db import DATABASE_URL
+
+# Events a subscriber may fall behind by before new ones are dropped for it
+SUBSCRIBER_QUEUE_SIZE = int(os.environ.get("SUBSCRIBER_QUEUE_SIZE", "100"))
+# Pause before reconnecting a lost LISTEN connection
+LISTEN_RETRY_DELAY = float(os.environ.get("LISTEN_RETRY_DELAY", "1"))
+
+# NOTIFY channels (see the triggers in init.sql) and the payload field
+# subscribers filter on
+CHANNELS = {
+    "message_received": "to_user_id",
+    "order_status_changed": "user_id",
+}
+
+class NotificationHub:
+    """One LISTEN connection per process, fanned out to every subscriber.
+
+    Subscribers are indexed by channel and filter key, so a notification only
+    touches the queues interested in it. Subscribing costs no database
+    connection or query."""
+
+    def __init__(self):
+        self.subscribers = {channel: defaultdict(set) for channel in CHANNELS}  # channel -> key -> queues
+        self.task = None
+        self.connected = False
+        self.received = 0
+        self.delivered = 0
+        self.dropped = 0
+        self.malformed = 0
+        self.reconnects = 0
+
+    def start(self):
+        self.task = asyncio.create_task(self.listen())
+
+    async def stop(self):
+        if self.task:
+            self.task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self.task
+            self.task = None
+
+    async def listen(self):
+        # Notifications sent while disconnected are lost; subscribers keep
+        # waiting and resume with the next one
+        while True:
+            try:
+                async with await psycopg.AsyncConnection.connect(DATABASE_URL, autocommit=True) as conn:
+                    for channel in CHANNELS:
+                        await conn.execute(f"LISTEN {channel}")
+                    self.connected = True
+                    async for notify in conn.notifies():
+                        try:
+                            event = json.loads(notify.payload)
+                            if not isinstance(event, dict):
+                                raise ValueError("payload is not a JSON object")
+                        except ValueError as e:
+                            # Skipped: one bad payload must not end every subscription
+                            self.malformed += 1
+                            print(f"Malformed {notify.channel} notification: {e}", file=sys.stderr)
+                            continue
+                        self.dispatch(notify.channel, event)
+            except psycopg.Error:
+                self.connected = False
+                self.reconnects += 1
+                await asyncio.sleep(LISTEN_RETRY_DELAY)
+
+    def dispatch(self, channel, event):
+        self.received += 1
+        by_key = self.subscribers[channel]
+        key = event.get(CHANNELS[channel])
+        # Filtered subscribers and catch-all ones, each once even when the key is None
+        queues = by_key.get(key, set()) | by_key.get(None, set())
+        for queue in queues:
+            try:
+                queue.put_nowait(event)
+                self.delivered += 1
+            except asyncio.QueueFull:
+                self.dropped += 1
+
+    async def subscribe(self, channel, key=None):
+        """Yield the events of `channel` whose filter field equals `key` (all when None)"""
+        queue = asyncio.Queue(SUBSCRIBER_QUEUE_SIZE)
+        by_key = self.subscribers[channel]
+        by_key[key].add(queue)
+        try:
+            while True:
+                yield await queue.get()
+        finally:
+            queues = by_key[key]
+            queues.discard(queue)
+            if not queues:
+                del by_key[key]
+
+    def stats(self):
+        return {
+            "connected": self.connected,
+            "subscribers": sum(len(queues) for by_key in self.subscribers.values() for queues in by_key.values()),
+            "received": self.received,
+            "delivered": self.delivered,
+            "dropped": self.dropped,
+            "malformed": self.malformed,
+            "reconnects": self.reconnects,
+        }
+
+notifications = NotificationHub()
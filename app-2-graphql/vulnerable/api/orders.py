@@ -0,0 +1,50 @@
+import os
+import asyncio
+import random
+from db import get_db_connection
+
+# Attempts with SKIP LOCKED before a final attempt that waits for the row lock
+ORDER_RETRIES = int(os.environ.get("ORDER_RETRIES", "3"))
+ORDER_RETRY_DELAY = float(os.environ.get("ORDER_RETRY_DELAY", "0.005"))
+
+# One statement: lock the product row, decrement stock only if enough is
+# left, and insert the order priced from the locked row. Nothing is written
+# when the product is missing, out of stock, or (with SKIP LOCKED) busy.
+# VULN: Negative quantities pass the stock check and add stock back
+PLACE_ORDER_SQL = """
+WITH locked AS (
+    SELECT id FROM products
+    WHERE id = %(product_id)s AND stock >= %(quantity)s
+    FOR UPDATE {skip_locked}
+), reserved AS (
+    UPDATE products SET stock = stock - %(quantity)s
+    FROM locked
+    WHERE products.id = locked.id AND products.stock >= %(quantity)s
+    RETURNING products.id, products.price
+)
+INSERT INTO orders (user_id, product_id, quantity, total_price)
+SELECT %(user_id)s, id, %(quantity)s, price * %(quantity)s FROM reserved
+RETURNING id
+"""
+
+async def place_order(user_id, product_id, quantity):
+    """Reserve stock and create the order atomically. Returns (order_id, error)."""
+    params = {"user_id": user_id, "product_id": product_id, "quantity": quantity}
+    for attempt in range(ORDER_RETRIES + 1):
+        skip_locked = "SKIP LOCKED" if attempt < ORDER_RETRIES else ""
+        async with get_db_connection() as conn:
+            cur = conn.cursor()
+            await cur.execute(PLACE_ORDER_SQL.format(skip_locked=skip_locked), params)
+            row = await cur.fetchone()
+            if row:
+                await conn.commit()
+                return row[0], None
+            # Nothing reserved: missing product, not enough stock, or row busy
+            await cur.execute("SELECT stock FROM products WHERE id = %s", (product_id,))
+            product = await cur.fetchone()
+        if product is None:
+            return None, "Product not found"
+        if product[0] < quantity:
+            return None, "Insufficient stock"
+        await asyncio.sleep(random.uniform(0, ORDER_RETRY_DELAY) * (attempt + 1))
+    return None, "Product is busy, try again"
@@ -0,0 +1,84 @@
+import os
+import base64
+from datetime import datetime
+from typing import Generic, List, Optional, TypeVar
+import strawberry
+from db import get_db_connection
+from mappers import mapped_cursor
+
+# Upper bound on `first`, keeps every page (and its memory) bounded
+MAX_PAGE_SIZE = int(os.environ.get("MAX_PAGE_SIZE", "1000"))
+# Rows pulled per round trip from the server-side cursor
+FETCH_SIZE = 200
+
+Node = TypeVar("Node")
+
+# Relay-style connection types
+@strawberry.type
+class PageInfo:
+    has_next_page: bool
+    end_cursor: Optional[str]
+
+@strawberry.type
+class Edge(Generic[Node]):
+    cursor: str
+    node: Node
+
+@strawberry.type
+class Connection(Generic[Node]):
+    edges: List[Edge[Node]]
+    page_info: PageInfo
+
+def encode_cursor(created_at, id):
+    """`created_at` is the timestamp's text form, as mapped onto the types"""
+    return base64.urlsafe_b64encode(f"{created_at}|{id}".encode()).decode()
+
+def decode_cursor(cursor):
+    try:
+        created_at, id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        return datetime.fromisoformat(created_at), int(id)
+    except ValueError:
+        raise ValueError("Invalid cursor")
+
+def page_statement(table, where, params, keyset, limit):
+    conditions = [where] if where else []
+    args = list(params)
+    if keyset:
+        conditions.append("(created_at, id) > (%s, %s)")
+        args.extend(keyset)
+    sql = f"SELECT * FROM {table}"
+    if conditions:
+        sql += " WHERE " + " AND ".join(conditions)
+    sql += " ORDER BY created_at, id LIMIT %s"
+    args.append(limit)
+    return sql, args
+
+async def fetch_page(table, cls, first, after=None, where=None, params=(), branches=None):
+    """Keyset page over (created_at, id), streamed from a server-side cursor.
+    With `branches`, a list of (where, params), the page is taken from the
+    UNION ALL of one bounded, limited query per branch, so each uses its
+    own index where an OR of the conditions would scan."""
+    first = max(0, min(first, MAX_PAGE_SIZE))
+    keyset = decode_cursor(after) if after else None
+    limit = first + 1  # One extra row tells us whether there is a next page
+    if branches:
+        statements = [page_statement(table, where, params, keyset, limit) for where, params in branches]
+        sql = " UNION ALL ".join(f"({sql})" for sql, _ in statements) + " ORDER BY created_at, id LIMIT %s"
+        args = [arg for _, branch_args in statements for arg in branch_args] + [limit]
+    else:
+        sql, args = page_statement(table, where, params, keyset, limit)
+
+    edges = []
+    has_next_page = False
+    async with get_db_connection() as conn:
+        async with mapped_cursor(conn, cls, name=f"{table}_page") as cur:
+            cur.itersize = FETCH_SIZE
+            await cur.execute(sql, args)
+            async for node in cur:
+                if len(edges) == first:
+                    has_next_page = True
+                    break
+                edges.append(Edge(cursor=encode_cursor(node.created_at, node.id), node=node))
+
+    end_cursor = edges[-1].cursor if edges else None
+    return Connection(edges=edges, page_info=PageInfo(has_next_page=has_next_page, end_cursor=end_cursor))
@@ -0,0 +1,139 @@
+import os
+import hashlib
+from collections import OrderedDict
+from graphql import GraphQLError
+from strawberry.extensions import SchemaExtension
+from strawberry.fastapi import GraphQLRouter
+from strawberry.http.exceptions import HTTPException
+from strawberry.types import ExecutionResult
+from strawberry.types.graphql import OperationType
+
+DOCUMENT_CACHE_SIZE = int(os.environ.get("DOCUMENT_CACHE_SIZE", "1000"))
+# Max age for GET responses of hashed queries, so an HTTP cache can serve them;
+# 0 (default) sends no Cache-Control, as lists go stale once data changes
+PERSISTED_QUERY_MAX_AGE = int(os.environ.get("PERSISTED_QUERY_MAX_AGE", "0"))
+
+def query_hash(query):
+    return hashlib.sha256(query.encode()).hexdigest()
+
+class DocumentCache:
+    """LRU of parsed and validated documents keyed by the query's sha256,
+    doubling as the Automatic Persisted Query store"""
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()  # sha256 -> (query, document, validation errors)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.persisted_not_found = 0
+
+    def get(self, sha):
+        entry = self.entries.get(sha)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(sha)
+        self.hits += 1
+        return entry
+
+    def put(self, sha, query, document, errors):
+        self.entries[sha] = (query, document, list(errors))
+        self.entries.move_to_end(sha)
+        if len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def lookup_query(self, sha):
+        entry = self.entries.get(sha)
+        if entry is None:
+            self.persisted_not_found += 1
+            return None
+        return entry[0]
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self.entries),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0,
+            "evictions": self.evictions,
+            "persisted_not_found": self.persisted_not_found,
+        }
+
+documents = DocumentCache(DOCUMENT_CACHE_SIZE)
+
+class DocumentCacheExtension(SchemaExtension):
+    """Skips parsing and validation for documents already in the cache"""
+
+    sha = None
+    cached = None
+
+    def on_parse(self):
+        ctx = self.execution_context
+        self.sha = query_hash(ctx.query)
+        self.cached = documents.get(self.sha)
+        if self.cached:
+            ctx.graphql_document = self.cached[1]
+        yield
+
+    def on_validate(self):
+        ctx = self.execution_context
+        if self.cached:
+            ctx.errors = list(self.cached[2])
+        yield
+        if not self.cached:
+            documents.put(self.sha, ctx.query, ctx.graphql_document, ctx.errors or [])
+
+class PersistedQueryRouter(GraphQLRouter):
+    """GraphQLRouter accepting Automatic Persisted Queries over POST and GET:
+    clients send `extensions.persistedQuery.sha256Hash` and only fall back
+    to the full query text when the hash is unknown"""
+
+    def should_render_graphql_ide(self, request):
+        return "extensions" not in request.query_params and super().should_render_graphql_ide(request)
+
+    async def execute_operation(self, request, context, root_value):
+        request_adapter = self.request_adapter_class(request)
+        content_type = request_adapter.content_type or ""
+
+        if "application/json" in content_type:
+            data = self.parse_json(await request_adapter.get_body())
+        elif request_adapter.method == "GET":
+            data = self.parse_query_params(request_adapter.query_params)
+            if isinstance(data.get("extensions"), str):
+                data["extensions"] = self.parse_json(data["extensions"])
+        else:
+            return await super().execute_operation(request, context, root_value)
+        if not isinstance(data, dict):
+            raise HTTPException(400, "request body must be a JSON object")
+
+        query = data.get("query")
+        persisted = (data.get("extensions") or {}).get("persistedQuery")
+        if persisted:
+            sha = persisted.get("sha256Hash")
+            if query is None:
+                query = documents.lookup_query(sha)
+                if query is None:
+                    error = GraphQLError("PersistedQueryNotFound", extensions={"code": "PERSISTED_QUERY_NOT_FOUND"})
+                    return ExecutionResult(data=None, errors=[error])
+            elif query_hash(query) != sha:
+                raise HTTPException(400, "provided sha does not match query")
+
+        allowed_operation_types = OperationType.from_http(request_adapter.method)
+        if not self.allow_queries_via_get and request_adapter.method == "GET":
+            allowed_operation_types = allowed_operation_types - {OperationType.QUERY}
+
+        result = await self.schema.execute(
+            query,
+            root_value=root_value,
+            variable_values=data.get("variables"),
+            context_value=context,
+            operation_name=data.get("operationName"),
+            allowed_operation_types=allowed_operation_types,
+        )
+        if PERSISTED_QUERY_MAX_AGE and persisted and request_adapter.method == "GET" and not result.errors:
+            context["response"].headers["Cache-Control"] = f"public, max-age={PERSISTED_QUERY_MAX_AGE}"
+        return result
@@ -0,0 +1,273 @@
+import os
+import json
+import asyncio
+from contextlib import AsyncExitStack, aclosing
+from typing import Optional
+import psycopg
+import strawberry
+from fastapi import Request
+from fastapi.responses import JSONResponse, StreamingResponse
+from graphql import GraphQLError, OperationType, parse, validate
+from graphql.execution import ExecutionContext
+from graphql.execution.collect_fields import collect_fields, should_include_node
+from graphql.execution.values import get_argument_values, get_directive_values
+from graphql.language import FieldNode, SelectionSetNode
+from graphql.pyutils import Path
+from graphql.type import get_named_type
+from strawberry.directive import DirectiveLocation
+from strawberry.utils.str_converters import to_snake_case
+from db import get_db_connection, read_only
+from mappers import mapped_cursor
+from cost import MAX_QUERY_COST, execution_cost
+from persisted import documents, query_hash
+
+# Incremental delivery (@defer / @stream) served as multipart/mixed, in the
+# format of the GraphQL incremental delivery RFC (deferSpec=20220824).
+# Streamed list fields read from a server-side cursor, so the first payload
+# only waits for `initialCount` rows whatever the size of the result.
+
+# Rows fetched from the server-side cursor per subsequent payload
+STREAM_BATCH_SIZE = int(os.environ.get("STREAM_BATCH_SIZE", "100"))
+
+BOUNDARY = "-"
+CONTENT_TYPE = f'multipart/mixed; boundary="{BOUNDARY}"; deferSpec=20220824'
+
+# Argument names are the GraphQL ones: strawberry passes them unconverted to
+# operation directive resolvers. On /graphql both directives are accepted
+# and everything is delivered inline, which the RFC allows.
+@strawberry.directive(locations=[DirectiveLocation.FIELD], description="Deliver list items incrementally")
+def stream(value, initialCount: int = 0, label: Optional[str] = None):
+    return value
+
+@strawberry.directive(
+    locations=[DirectiveLocation.FRAGMENT_SPREAD, DirectiveLocation.INLINE_FRAGMENT],
+    description="Deliver this fragment after the rest of the response",
+)
+def defer(label: Optional[str] = None):
+    return None
+
+def directive_args(exe, name, node):
+    return get_directive_values(exe.schema.get_directive(name), node, exe.variable_values)
+
+def split_deferred(exe, selections):
+    """Separate fragments marked @defer from the selections delivered now"""
+    now, deferred = [], []
+    for selection in selections:
+        if not isinstance(selection, FieldNode) and should_include_node(exe.variable_values, selection):
+            args = directive_args(exe, "defer", selection)
+            if args is not None:
+                deferred.append((args.get("label"), selection))
+                continue
+        now.append(selection)
+    return now, deferred
+
+def fields_of(exe, parent_type, selections):
+    return collect_fields(
+        exe.schema, exe.fragments, exe.variable_values, parent_type, SelectionSetNode(selections=tuple(selections))
+    )
+
+async def complete(exe, parent_type, source, path, fields):
+    """Execute `fields` on one object; field errors are collected on `exe`"""
+    try:
+        result = exe.execute_fields(parent_type, source, path, fields)
+        if exe.is_awaitable(result):
+            result = await result
+        return result
+    except GraphQLError as error:
+        exe.collected_errors.errors.append(error)
+        return None
+
+class StreamedField:
+    """A root list field marked @stream, read from its own server-side cursor"""
+
+    def __init__(self, exe, node, source):
+        query_type = exe.schema.query_type
+        field_def = query_type.fields[node.name.value]
+        args = get_argument_values(field_def, node, exe.variable_values)
+        self.cls, statement = source
+        self.sql, self.params = statement(**{to_snake_case(name): value for name, value in args.items()})
+        self.key = node.alias.value if node.alias else node.name.value
+        self.path = Path(None, self.key, query_type.name)
+        self.item_type = get_named_type(field_def.type)
+        stream_args = directive_args(exe, "stream", node)
+        self.initial_count = stream_args["initialCount"]
+        self.label = stream_args.get("label")
+        now, deferred = split_deferred(exe, node.selection_set.selections)
+        self.fields = fields_of(exe, self.item_type, now)
+        self.deferred = [(label, fields_of(exe, self.item_type, [fragment])) for label, fragment in deferred]
+        self.count = 0
+        self.cursor = None
+
+    async def items(self, exe, rows):
+        """Complete a batch together, so nested DataLoaders batch across it"""
+        paths = [self.path.add_key(self.count + i, self.item_type.name) for i in range(len(rows))]
+        self.count += len(rows)
+        items = await asyncio.gather(*(
+            complete(exe, self.item_type, row, path, self.fields) for row, path in zip(rows, paths)
+        ))
+        return items, list(zip(rows, paths))
+
+    async def deferred_parts(self, exe, completed):
+        parts = []
+        for label, fields in self.deferred:
+            results = await asyncio.gather(*(
+                complete(exe, self.item_type, row, path, fields) for row, path in completed
+            ))
+            for (row, path), data in zip(completed, results):
+                parts.append(incremental(data=data, path=path.as_list(), label=label))
+        return parts
+
+def incremental(label=None, **fields):
+    return {**fields, "label": label} if label else fields
+
+def with_errors(exe, payload, reported):
+    """Attach the field errors raised since the previous payload"""
+    errors = exe.collected_errors.errors[reported:]
+    if errors:
+        payload["errors"] = [error.formatted for error in errors]
+    return payload, len(exe.collected_errors.errors)
+
+async def payloads(exe, root_fields, root_deferred, streams):
+    token = read_only.set(True)  # Queries only: may read from the replica
+    try:
+        query_type = exe.schema.query_type
+        async with AsyncExitStack() as stack:
+            data = await complete(exe, query_type, None, None, root_fields) or {}
+            deferred_items = []
+            if streams:
+                conn = await stack.enter_async_context(get_db_connection())
+                for index, field in enumerate(streams):
+                    field.cursor = await stack.enter_async_context(
+                        mapped_cursor(conn, field.cls, name=f"stream_{index}")
+                    )
+                    await field.cursor.execute(field.sql, field.params)
+                    rows = await field.cursor.fetchmany(field.initial_count) if field.initial_count else []
+                    data[field.key], completed = await field.items(exe, rows)
+                    deferred_items.append((field, completed))
+
+            has_next = bool(streams or root_deferred)
+            payload, reported = with_errors(exe, {"data": data}, 0)
+            yield {**payload, "hasNext": has_next}
+
+            for label, fields in root_deferred:
+                part = incremental(data=await complete(exe, query_type, None, None, fields), path=[], label=label)
+                payload, reported = with_errors(exe, {"incremental": [part]}, reported)
+                yield {**payload, "hasNext": True}
+
+            for field, completed in deferred_items:
+                parts = await field.deferred_parts(exe, completed)
+                if parts:
+                    payload, reported = with_errors(exe, {"incremental": parts}, reported)
+                    yield {**payload, "hasNext": True}
+                while True:
+                    rows = await field.cursor.fetchmany(STREAM_BATCH_SIZE)
+                    if not rows:
+                        break
+                    start = field.count
+                    items, completed = await field.items(exe, rows)
+                    part = incremental(items=items, path=[field.key, start], label=field.label)
+                    payload, reported = with_errors(exe, {"incremental": [part]}, reported)
+                    yield {**payload, "hasNext": True}
+                    parts = await field.deferred_parts(exe, completed)
+                    if parts:
+                        payload, reported = with_errors(exe, {"incremental": parts}, reported)
+                        yield {**payload, "hasNext": True}
+
+        if has_next:
+            yield {"hasNext": False}
+    finally:
+        read_only.reset(token)
+
+def encode_part(payload):
+    return f"\r\nContent-Type: application/json; charset=utf-8\r\n\r\n{json.dumps(payload)}\r\n--{BOUNDARY}"
+
+async def multipart(payloads, request):
+    """The payloads as multipart parts. Stops, closing the cursors and
+    returning the connection, as soon as the client has gone."""
+    yield f"\r\n--{BOUNDARY}"
+    async with aclosing(payloads):
+        try:
+            async for payload in payloads:
+                if await request.is_disconnected():
+                    return
+                yield encode_part(payload)
+        except psycopg.Error as e:
+            # Headers are already sent: report the failure as the last payload
+            yield encode_part({"errors": [{"message": str(e)}], "hasNext": False})
+    yield "--\r\n"
+
+def parse_document(schema, query):
+    """Parse and validate through the shared document cache"""
+    sha = query_hash(query)
+    cached = documents.get(sha)
+    if cached:
+        return cached[1], cached[2]
+    try:
+        document = parse(query)
+    except GraphQLError as error:
+        return None, [error]
+    errors = validate(schema, document)
+    documents.put(sha, query, document, errors)
+    return document, errors
+
+def error_response(errors, status_code=400):
+    return JSONResponse({"data": None, "errors": [error.formatted for error in errors]}, status_code=status_code)
+
+def stream_endpoint(schema, context_getter, sources):
+    """POST endpoint executing a query with @defer/@stream support. `sources`
+    maps root list fields to (type, statement builder) for streaming."""
+    gql_schema = schema._schema
+
+    async def endpoint(request: Request):
+        try:
+            data = await request.json()
+        except ValueError:
+            return error_response([GraphQLError("Request body is not valid JSON")])
+        if not isinstance(data, dict):
+            return error_response([GraphQLError("Request body must be a JSON object")])
+        query = data.get("query") or ""
+        variables = data.get("variables")
+        operation_name = data.get("operationName")
+
+        document, errors = parse_document(gql_schema, query)
+        if errors:
+            return error_response(errors)
+        context = {**await context_getter(), "request": request}
+        exe = ExecutionContext.build(gql_schema, document, None, context, variables, operation_name)
+        if isinstance(exe, list):
+            return error_response(exe)
+        # Costed on the coerced variables: invalid ones were reported above
+        cost = execution_cost(exe)
+        if MAX_QUERY_COST and cost > MAX_QUERY_COST:
+            error = GraphQLError(
+                f"Query cost {cost} exceeds the maximum of {MAX_QUERY_COST}",
+                extensions={"code": "QUERY_TOO_EXPENSIVE"},
+            )
+            return error_response([error])
+        if exe.operation.operation != OperationType.QUERY:
+            return error_response([GraphQLError("Only queries can be delivered incrementally")], 405)
+
+        selections, root_deferred = split_deferred(exe, exe.operation.selection_set.selections)
+        now, streams = [], []
+        for selection in selections:
+            if (
+                isinstance(selection, FieldNode)
+                and selection.name.value in sources
+                and should_include_node(exe.variable_values, selection)
+                and directive_args(exe, "stream", selection) is not None
+            ):
+                field = StreamedField(exe, selection, sources[selection.name.value])
+                if field.initial_count < 0:
+                    return error_response([GraphQLError("initialCount must be a positive integer", selection)])
+                streams.append(field)
+            else:
+                now.append(selection)
+
+        query_type = gql_schema.query_type
+        root_fields = fields_of(exe, query_type, now)
+        root_deferred = [(label, fields_of(exe, query_type, [fragment])) for label, fragment in root_deferred]
+        return StreamingResponse(
+            multipart(payloads(exe, root_fields, root_deferred, streams), request), media_type=CONTENT_TYPE
+        )
+
+    return endpoint
@@ -0,0 +1,219 @@
+import os
+import re
+import time
+import inspect
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from psycopg import AsyncCursor, AsyncServerCursor
+from prometheus_client import REGISTRY, CollectorRegistry, Histogram, generate_latest, multiprocess
+from strawberry.extensions import SchemaExtension
+
+# Per-resolver timing. Every resolver that awaits (root fields, DataLoader
+# backed relationships) is timed into a histogram per field; the statements
+# it runs are timed per normalized SQL text, split into connection acquire,
+# execute and row mapping. Requests sending the TRACE_HEADER also get the
+# spans back in the response `extensions.tracing`.
+#
+# Under gunicorn, set PROMETHEUS_MULTIPROC_DIR so /metrics sums all workers.
+
+TRACE_HEADER = "x-graphql-trace"
+# Distinct SQL statements tracked per process; statements built from user
+# input (the injectable ones) otherwise grow the label set without bound
+MAX_SQL_STATEMENTS = int(os.environ.get("MAX_SQL_STATEMENTS", "200"))
+
+# Most statements finish well under the default buckets' 5 ms floor
+BUCKETS = (0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+OPERATION_SECONDS = Histogram(
+    "graphql_operation_duration_seconds", "GraphQL operation latency", ["operation"], buckets=BUCKETS
+)
+RESOLVER_SECONDS = Histogram(
+    "graphql_resolver_duration_seconds", "Async resolver latency by field", ["field"], buckets=BUCKETS
+)
+ACQUIRE_SECONDS = Histogram(
+    "db_connection_acquire_seconds", "Wait for a pooled connection", ["pool"], buckets=BUCKETS
+)
+SQL_SECONDS = Histogram(
+    "db_statement_duration_seconds", "Statement execute (and server-side cursor fetch) latency",
+    ["statement"], buckets=BUCKETS,
+)
+MAPPING_SECONDS = Histogram(
+    "db_row_mapping_seconds", "Row loading and mapping of fetched results", ["statement"], buckets=BUCKETS
+)
+
+# The request's trace and the resolver being timed in the current task; both
+# None unless the client asked for spans
+current_trace = ContextVar("current_trace", default=None)
+current_resolver = ContextVar("current_resolver", default=None)
+
+LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+statements = set()
+
+def statement_key(query, context):
+    """Statement text with literals replaced by `?` and whitespace collapsed"""
+    if isinstance(query, bytes):
+        query = query.decode()
+    elif not isinstance(query, str):
+        query = query.as_string(context)
+    key = " ".join(LITERALS.sub("?", query).split())
+    if key not in statements:
+        if len(statements) >= MAX_SQL_STATEMENTS:
+            return "other"
+        statements.add(key)
+    return key
+
+class Trace:
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.resolvers = []
+
+    def offset(self, started):
+        return round((started - self.start) * 1000, 3)
+
+    def as_dict(self, duration):
+        return {"duration_ms": round(duration * 1000, 3), "resolvers": self.resolvers}
+
+def span(name, started, elapsed, **attrs):
+    """Attach a span to the resolver being traced in this task, if any"""
+    resolver = current_resolver.get()
+    if resolver is not None:
+        resolver["spans"].append({
+            "name": name,
+            "start_ms": current_trace.get().offset(started),
+            "duration_ms": round(elapsed * 1000, 3),
+            **attrs,
+        })
+
+@asynccontextmanager
+async def timed_connection(connection, pool_name):
+    """Wrap a pool's `connection()` context, timing the checkout"""
+    started = time.perf_counter()
+    async with connection as conn:
+        elapsed = time.perf_counter() - started
+        ACQUIRE_SECONDS.labels(pool_name).observe(elapsed)
+        span("acquire", started, elapsed, pool=pool_name)
+        yield conn
+
+class TimedCursorMixin:
+    statement = None
+    mapping_span = "map"
+
+    async def execute(self, query, params=None, **kwargs):
+        self.statement = statement_key(query, self)
+        started = time.perf_counter()
+        try:
+            return await super().execute(query, params, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - started
+            SQL_SECONDS.labels(self.statement).observe(elapsed)
+            span("execute", started, elapsed, statement=self.statement)
+
+    def fetched(self, started, rows):
+        elapsed = time.perf_counter() - started
+        # Client-side results are already in memory: fetching only loads and
+        # maps rows. Server-side cursors go back to the server for them.
+        histogram = MAPPING_SECONDS if self.mapping_span == "map" else SQL_SECONDS
+        histogram.labels(self.statement or "other").observe(elapsed)
+        span(self.mapping_span, started, elapsed, statement=self.statement, rows=rows)
+
+    async def fetchone(self):
+        started = time.perf_counter()
+        row = await super().fetchone()
+        self.fetched(started, int(row is not None))
+        return row
+
+    async def fetchmany(self, size=0):
+        started = time.perf_counter()
+        rows = await super().fetchmany(size)
+        self.fetched(started, len(rows))
+        return rows
+
+    async def fetchall(self):
+        started = time.perf_counter()
+        rows = await super().fetchall()
+        self.fetched(started, len(rows))
+        return rows
+
+class TimedCursor(TimedCursorMixin, AsyncCursor):
+    async def executemany(self, query, params_seq, **kwargs):
+        self.statement = statement_key(query, self)
+        started = time.perf_counter()
+        try:
+            return await super().executemany(query, params_seq, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - started
+            SQL_SECONDS.labels(self.statement).observe(elapsed)
+            span("execute", started, elapsed, statement=self.statement)
+
+class TimedServerCursor(TimedCursorMixin, AsyncServerCursor):
+    mapping_span = "fetch"
+
+    async def __aiter__(self):
+        # Same batching as psycopg's, through the timed fetchmany
+        while True:
+            rows = await self.fetchmany(self.itersize)
+            for row in rows:
+                yield row
+            if len(rows) < self.itersize:
+                break
+
+async def configure_connection(conn):
+    """Pool `configure` hook: time every cursor opened on the connection"""
+    conn.cursor_factory = TimedCursor
+    conn.server_cursor_factory = TimedServerCursor
+
+class ResolverTracing(SchemaExtension):
+    """Times async resolvers and, when the request carries TRACE_HEADER,
+    returns their spans in the response `extensions.tracing`"""
+
+    trace = None
+    duration = None
+
+    def on_execute(self):
+        ctx = self.execution_context
+        request = (ctx.context or {}).get("request")
+        if request is not None and request.headers.get(TRACE_HEADER, "").lower() in ("1", "true"):
+            self.trace = Trace()
+        token = current_trace.set(self.trace)
+        started = time.perf_counter()
+        yield
+        self.duration = time.perf_counter() - started
+        current_trace.reset(token)
+        OPERATION_SECONDS.labels(ctx.operation_type.value.lower()).observe(self.duration)
+
+    def resolve(self, _next, root, info, *args, **kwargs):
+        result = _next(root, info, *args, **kwargs)
+        if not inspect.isawaitable(result):
+            return result  # Plain attribute reads are not worth a span
+        return self.timed(result, info)
+
+    async def timed(self, result, info):
+        field = f"{info.parent_type.name}.{info.field_name}"
+        trace = current_trace.get()
+        resolver = None
+        started = time.perf_counter()
+        if trace is not None:
+            resolver = {"path": info.path.as_list(), "field": field, "start_ms": trace.offset(started), "spans": []}
+            trace.resolvers.append(resolver)
+        token = current_resolver.set(resolver)
+        try:
+            return await result
+        finally:
+            current_resolver.reset(token)
+            elapsed = time.perf_counter() - started
+            RESOLVER_SECONDS.labels(field).observe(elapsed)
+            if resolver is not None:
+                resolver["duration_ms"] = round(elapsed * 1000, 3)
+
+    def get_results(self):
+        if self.trace is None or self.duration is None:
+            return {}
+        return {"tracing": self.trace.as_dict(self.duration)}
+
+def render_metrics():
+    """Prometheus text exposition, summed over workers in multiprocess mode"""
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry)
+    return generate_latest(REGISTRY)
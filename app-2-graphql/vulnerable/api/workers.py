@@ -0,0 +1,7 @@
+from uvicorn.workers import UvicornWorker
+
+class ProductionWorker(UvicornWorker):
+    """Uvicorn worker for gunicorn pinned to uvloop and httptools (from
+    uvicorn[standard]), failing to boot if the app's lifespan fails"""
+
+    CONFIG_KWARGS = {"loop": "uvloop", "http": "httptools", "lifespan": "on"}
@@ -13,25 +13,132 @@ document.querySelectorAll(".tab-btn").forEach((btn) => {
   });
 });
 
+// SHA-256 of the query text for Automatic Persisted Queries (only available in secure contexts)
+async function sha256(text) {
+  if (!window.crypto?.subtle) return null;
+  const digest = await crypto.subtle.digest("SHA-256", new TextEncoder().encode(text));
+  return Array.from(new Uint8Array(digest))
+    .map((b) => b.toString(16).padStart(2, "0"))
+    .join("");
+}
+
+async function postGraphQL(body) {
+  const response = await fetch(API_URL, {
+    method: "POST",
+    headers: {
+      "Content-Type": "application/json",
+    },
+    body: JSON.stringify(body),
+  });
+  return response.json();
+}
+
 // Helper function to execute GraphQL query
+// Queries are first sent as a hash over GET (cacheable), the full text is only sent when the server does not know the hash
 async function executeGraphQL(query, variables = {}) {
   try {
-    const response = await fetch(API_URL, {
+    const hash = await sha256(query);
+    let data;
+
+    if (!hash) {
+      data = await postGraphQL({ query, variables });
+    } else {
+      const extensions = { persistedQuery: { version: 1, sha256Hash: hash } };
+      if (!query.trim().startsWith("mutation")) {
+        const params = new URLSearchParams({
+          variables: JSON.stringify(variables),
+          extensions: JSON.stringify(extensions),
+        });
+        const response = await fetch(`${API_URL}?${params}`, { headers: { Accept: "application/json" } });
+        data = await response.json();
+      }
+      if (!data || data.errors?.some((e) => e.extensions?.code === "PERSISTED_QUERY_NOT_FOUND")) {
+        data = await postGraphQL({ query, variables, extensions });
+      }
+    }
+
+    displayResults(data);
+    return data;
+  } catch (error) {
+    displayResults({ error: error.message });
+  }
+}
+
+// Incremental delivery: reads multipart/mixed parts from /graphql/stream as they arrive
+// and merges streamed items and deferred data into the displayed result
+async function streamGraphQL(query, variables = {}) {
+  try {
+    const response = await fetch(`${API_URL}/stream`, {
       method: "POST",
       headers: {
         "Content-Type": "application/json",
+        Accept: "multipart/mixed; deferSpec=20220824, application/json",
       },
       body: JSON.stringify({ query, variables }),
     });
-
-    const data = await response.json();
-    displayResults(data);
-    return data;
+    if (!response.headers.get("Content-Type")?.startsWith("multipart/mixed")) {
+      displayResults(await response.json());
+      return;
+    }
+
+    const result = { data: null, errors: [] };
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = "";
+    for (;;) {
+      const { done, value } = await reader.read();
+      if (done) break;
+      buffer += decoder.decode(value, { stream: true });
+      const parts = buffer.split("\r\n---");
+      buffer = parts.pop();
+      for (const part of parts) {
+        const body = part.slice(part.indexOf("\r\n\r\n") + 4);
+        if (part.includes("\r\n\r\n")) mergePayload(result, JSON.parse(body));
+      }
+      displayResults(result);
+    }
   } catch (error) {
     displayResults({ error: error.message });
   }
 }
 
+function mergePayload(result, payload) {
+  if (payload.data) result.data = payload.data;
+  if (payload.errors) result.errors.push(...payload.errors);
+  for (const { items, data, path } of payload.incremental || []) {
+    let target = result.data;
+    const keys = items ? path.slice(0, -1) : path;
+    for (const key of keys) target = target[key];
+    if (items) target.push(...items);
+    else Object.assign(target, data);
+  }
+}
+
+// Subscriptions over WebSocket (graphql-transport-ws); one active subscription at a time
+let subscriptionSocket = null;
+
+function subscribeGraphQL(query, variables = {}) {
+  if (subscriptionSocket) subscriptionSocket.close();
+  const events = [];
+  const socket = new WebSocket(API_URL.replace(/^http/, "ws"), "graphql-transport-ws");
+  subscriptionSocket = socket;
+
+  socket.onopen = () => socket.send(JSON.stringify({ type: "connection_init" }));
+  socket.onmessage = (event) => {
+    const message = JSON.parse(event.data);
+    if (message.type === "connection_ack") {
+      socket.send(JSON.stringify({ id: "1", type: "subscribe", payload: { query, variables } }));
+      displayResults({ subscribed: true, events });
+    } else if (message.type === "next") {
+      events.unshift(message.payload);
+      displayResults({ subscribed: true, events });
+    } else if (message.type === "error") {
+      displayResults({ errors: message.payload });
+    }
+  };
+  socket.onerror = () => displayResults({ error: "Subscription connection failed" });
+}
+
 // Display results
 function displayResults(data) {
   const output = document.getElementById("output");
@@ -110,6 +217,27 @@ async function searchUsers() {
   await executeGraphQL(query, { query: searchQuery });
 }
 
+let typeaheadTimer = null;
+
+function typeaheadUsers() {
+  clearTimeout(typeaheadTimer);
+  typeaheadTimer = setTimeout(async () => {
+    const prefix = getValue("user-typeahead");
+    if (prefix.trim().length < 2) return;
+
+    const query = `
+        query UserTypeahead($prefix: String!) {
+            userTypeahead(prefix: $prefix) {
+                id
+                username
+                email
+            }
+        }
+    `;
+    await executeGraphQL(query, { prefix });
+  }, 200);
+}
+
 async function createUser() {
   const username = getValue("new-username");
   const email = getValue("new-email");
@@ -195,6 +323,23 @@ async function fetchAllPosts() {
   await executeGraphQL(query);
 }
 
+async function streamAllPosts() {
+  const query = `
+        query {
+            posts @stream(initialCount: 10) {
+                id
+                title
+                authorId
+                createdAt
+                ... @defer {
+                    author { username }
+                }
+            }
+        }
+    `;
+  await streamGraphQL(query);
+}
+
 async function fetchPost() {
   const id = prompt("Enter Post ID:");
   if (!id) return;
@@ -538,3 +683,36 @@ async function executeCustomQuery() {
 
   await executeGraphQL(query);
 }
+
+async function watchMessages() {
+  const userId = getValue("messages-user-id");
+  if (!userId) return;
+
+  const query = `
+        subscription MessageReceived($userId: Int!) {
+            messageReceived(userId: $userId) {
+                id
+                fromUserId
+                toUserId
+                content
+                createdAt
+            }
+        }
+    `;
+  subscribeGraphQL(query, { userId: parseInt(userId) });
+}
+
+async function watchOrderStatus() {
+  const query = `
+        subscription {
+            orderStatusChanged {
+                id
+                userId
+                productId
+                status
+                totalPrice
+            }
+        }
+    `;
+  subscribeGraphQL(query);
+}
@@ -63,6 +63,88 @@ CREATE TABLE messages (
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
 
+-- Keyset pagination indexes: (created_at, id) cursors seek straight to the page
+CREATE INDEX idx_users_created_at_id ON users (created_at, id);
+CREATE INDEX idx_posts_created_at_id ON posts (created_at, id);
+CREATE INDEX idx_posts_author_created_at_id ON posts (author_id, created_at, id);
+CREATE INDEX idx_products_created_at_id ON products (created_at, id);
+CREATE INDEX idx_orders_created_at_id ON orders (created_at, id);
+CREATE INDEX idx_orders_user_created_at_id ON orders (user_id, created_at, id);
+CREATE INDEX idx_messages_created_at_id ON messages (created_at, id);
+
+-- Lookup indexes for resolver filters, DataLoader batches and cascading deletes
+-- (posts.author_id and orders.user_id are covered by the keyset indexes above)
+CREATE INDEX idx_comments_post_id ON comments (post_id);
+CREATE INDEX idx_comments_author_id ON comments (author_id);
+CREATE INDEX idx_orders_product_id ON orders (product_id);
+CREATE INDEX idx_messages_from_user_id ON messages (from_user_id, created_at, id);
+CREATE INDEX idx_messages_to_user_id ON messages (to_user_id, created_at, id);
+
+-- Full-text search document per user, kept current by trigger
+-- (a side table so SELECT * FROM users keeps its shape)
+CREATE TABLE user_search (
+    user_id INTEGER PRIMARY KEY REFERENCES users(id) ON DELETE CASCADE,
+    document TSVECTOR NOT NULL
+);
+
+CREATE INDEX idx_user_search_document ON user_search USING GIN (document);
+
+CREATE FUNCTION user_search_refresh() RETURNS trigger AS $$
+BEGIN
+    -- Username matches rank above email matches; email is split on @ and .
+    INSERT INTO user_search (user_id, document)
+    VALUES (
+        NEW.id,
+        setweight(to_tsvector('simple', NEW.username), 'A') ||
+        setweight(to_tsvector('simple', translate(NEW.email, '@.', '  ')), 'B')
+    )
+    ON CONFLICT (user_id) DO UPDATE SET document = EXCLUDED.document;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER users_search_refresh
+    AFTER INSERT OR UPDATE OF username, email ON users
+    FOR EACH ROW EXECUTE FUNCTION user_search_refresh();
+
+-- Change notifications for GraphQL subscriptions, received by the single
+-- LISTEN connection of each API process (api/notify.py). NOTIFY payloads are
+-- limited to 8000 bytes: longer messages only carry their ids and are read
+-- back by the subscriber.
+CREATE FUNCTION notify_message_received() RETURNS trigger AS $$
+DECLARE
+    payload TEXT := json_build_object(
+        'id', NEW.id, 'from_user_id', NEW.from_user_id, 'to_user_id', NEW.to_user_id,
+        'content', NEW.content, 'is_read', NEW.is_read, 'created_at', NEW.created_at::text
+    )::text;
+BEGIN
+    IF octet_length(payload) > 7900 THEN
+        payload := json_build_object('id', NEW.id, 'to_user_id', NEW.to_user_id)::text;
+    END IF;
+    PERFORM pg_notify('message_received', payload);
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER messages_notify
+    AFTER INSERT ON messages
+    FOR EACH ROW EXECUTE FUNCTION notify_message_received();
+
+CREATE FUNCTION notify_order_status_changed() RETURNS trigger AS $$
+BEGIN
+    PERFORM pg_notify('order_status_changed', json_build_object(
+        'id', NEW.id, 'user_id', NEW.user_id, 'product_id', NEW.product_id, 'quantity', NEW.quantity,
+        'total_price', NEW.total_price, 'status', NEW.status, 'created_at', NEW.created_at::text
+    )::text);
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER orders_notify
+    AFTER UPDATE OF status ON orders
+    FOR EACH ROW WHEN (OLD.status IS DISTINCT FROM NEW.status)
+    EXECUTE FUNCTION notify_order_status_changed();
+
 -- Insert sample data
 INSERT INTO users (username, email, password, role, salary, ssn) VALUES
     ('admin', 'admin@example.com', 'admin123', 'admin', 150000.00, '123-45-6789'),
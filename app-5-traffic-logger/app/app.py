@@ -1,12 +1,39 @@
-from flask import Flask, request, render_template
+import os
+import sys
+from itertools import islice
+from flask import Flask, Response, request, render_template, jsonify, stream_with_context, url_for
 from datetime import datetime
-from collections import defaultdict
+from ringbuffer import RequestRecord, RingBuffer
+from logwriter import LogWriter
+from counters import AGGREGATOR_SOCKET, IP_COUNTS, Aggregator, ShardedCounter
 
 app = Flask(__name__)
 
+# Most recent requests kept in memory; the cost per request does not depend
+# on the capacity
+REQUEST_LOG_CAPACITY = int(os.environ.get('REQUEST_LOG_CAPACITY', '1000'))
+# Rows per page on /requests and /api/requests (?limit=, up to MAX_PAGE_SIZE)
+PAGE_SIZE = int(os.environ.get('PAGE_SIZE', '100'))
+MAX_PAGE_SIZE = int(os.environ.get('MAX_PAGE_SIZE', '1000'))
+# Rendered template pieces sent per chunk of a streamed page
+STREAM_BUFFER = int(os.environ.get('STREAM_BUFFER', '50'))
+# Rows shown on /ips, busiest first
+IP_TOP_K = int(os.environ.get('IP_TOP_K', '1000'))
+
 # Store requests in memory
-requests_log = []
-ip_counts = defaultdict(int)
+requests_log = RingBuffer(REQUEST_LOG_CAPACITY)
+# Sharded counters, merged when /ips is read; with AGGREGATOR_SOCKET set,
+# the counts of all worker processes are merged through it
+ip_counts = ShardedCounter()
+ip_view = Aggregator(ip_counts) if AGGREGATOR_SOCKET else ip_counts
+
+def print_requests(batch):
+    """Console lines for a batch of logged requests"""
+    sys.stdout.write(''.join(f"[{r.timestamp}] {r.ip} - {r.method} {r.path}\n" for r in batch))
+    sys.stdout.flush()
+
+# Console output is written in batches by a background thread
+log_writer = LogWriter(print_requests)
 
 @app.before_request
 def log_request():
@@ -14,40 +41,73 @@ def log_request():
     timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
     ip_address = request.remote_addr or request.environ.get('REMOTE_ADDR', 'Unknown')
     
-    request_data = {
-        'timestamp': timestamp,
-        'ip': ip_address,
-        'method': request.method,
-        'path': request.path,
-        'user_agent': request.headers.get('User-Agent', 'Unknown'),
-        'referer': request.headers.get('Referer', 'None'),
-        'query_string': request.query_string.decode('utf-8') if request.query_string else '',
-    }
+    request_data = RequestRecord(
+        timestamp,
+        ip_address,
+        request.method,
+        request.path,
+        request.headers.get('User-Agent', 'Unknown'),
+        request.headers.get('Referer', 'None'),
+        request.query_string.decode('utf-8') if request.query_string else '',
+    )
     
+    # Overwrites the oldest entry once REQUEST_LOG_CAPACITY is reached
     requests_log.append(request_data)
-    ip_counts[ip_address] += 1
-    
-    # Keep only last 1000 requests to avoid memory issues
-    if len(requests_log) > 1000:
-        requests_log.pop(0)
-    
-    print(f"[{timestamp}] {ip_address} - {request.method} {request.path}")
+    ip_counts.add(ip_address)
+    log_writer.put(request_data)
 
 @app.route('/')
 def index():
     """Main page with links to both views"""
     return render_template('index.html')
 
+def page_args():
+    """Cursor (`before`: id of the last row already seen), offset and page
+    size of a paginated request"""
+    before = request.args.get('before', type=int)
+    offset = max(0, request.args.get('offset', 0, type=int))
+    limit = min(max(1, request.args.get('limit', PAGE_SIZE, type=int)), MAX_PAGE_SIZE)
+    return before, offset, limit
+
+def paginate(entries, offset, limit):
+    """One page of (id, item) pairs, newest first, and the cursor of the
+    next page (None on the last one)"""
+    page = list(islice(entries, offset, offset + limit + 1))
+    next_cursor = page[limit - 1][0] if len(page) > limit else None
+    return page[:limit], next_cursor
+
+def stream_page(template_name, **context):
+    """Render a template as a chunked response, so the first rows reach the
+    browser before the last ones are rendered"""
+    app.update_template_context(context)
+    stream = app.jinja_env.get_template(template_name).stream(context)
+    stream.enable_buffering(STREAM_BUFFER)
+    return Response(stream_with_context(stream), mimetype='text/html')
+
 @app.route('/requests')
 def all_requests():
-    """Display all individual requests"""
-    return render_template('requests.html', requests=reversed(requests_log), total=len(requests_log))
+    """Display one page of individual requests, newest first"""
+    before, offset, limit = page_args()
+    page, next_cursor = paginate(requests_log.entries(before), offset, limit)
+    next_url = url_for('all_requests', before=next_cursor, limit=limit) if next_cursor is not None else None
+    return stream_page('requests.html', requests=page, total=len(requests_log),
+                       next_cursor=next_cursor, next_url=next_url, limit=limit)
+
+@app.route('/api/requests')
+def api_requests():
+    """One page of requests as JSON; pass `next` back as `before` for the
+    following page"""
+    before, offset, limit = page_args()
+    page, next_cursor = paginate(requests_log.entries(before), offset, limit)
+    return jsonify(requests=[dict(record.to_dict(), id=sequence) for sequence, record in page],
+                   next=next_cursor, total=len(requests_log))
 
 @app.route('/ips')
 def unique_ips():
     """Display unique IPs and their request counts"""
-    sorted_ips = sorted(ip_counts.items(), key=lambda x: x[1], reverse=True)
-    return render_template('ips.html', ips=sorted_ips, total_unique=len(sorted_ips))
+    summary = ip_view.summary()
+    return render_template('ips.html', ips=summary.top(IP_TOP_K), total_unique=len(summary),
+                           approximate=IP_COUNTS == 'topk', floor=summary.floor)
 
 # Catch-all route to log any other requests
 @app.route('/<path:path>', methods=['GET', 'POST', 'PUT', 'DELETE', 'PATCH', 'OPTIONS', 'HEAD'])
@@ -0,0 +1,359 @@
+import os
+import sys
+import json
+import time
+import fcntl
+import heapq
+import socket
+import threading
+import itertools
+import socketserver
+
+# Unix socket through which the worker processes of one logger merge their
+# counts; unset when a single process serves all requests
+AGGREGATOR_SOCKET = os.environ.get('AGGREGATOR_SOCKET')
+# Seconds between two pushes of a worker's counts to the aggregator
+AGGREGATOR_INTERVAL = float(os.environ.get('AGGREGATOR_INTERVAL', '1'))
+
+# 'exact' counts every IP ever seen; 'topk' keeps IP_SUMMARY_SIZE counters
+# (per shard) whatever the number of IPs, with a bounded overestimate
+IP_COUNTS = os.environ.get('IP_COUNTS', 'exact')
+IP_SUMMARY_SIZE = int(os.environ.get('IP_SUMMARY_SIZE', '10000'))
+# Shards the counts are spread over, each with its own lock
+IP_COUNT_SHARDS = int(os.environ.get('IP_COUNT_SHARDS', '8'))
+
+class Summary:
+    """Merged counts: key -> (count, error). A key's true count lies in
+    [count - error, count]; keys not listed occurred at most `floor` times."""
+
+    def __init__(self, counts, floor=0):
+        self.counts = counts
+        self.floor = floor
+
+    def __len__(self):
+        return len(self.counts)
+
+    def top(self, k):
+        """The k highest counts as (key, count, error), highest first"""
+        return [(key, count, error) for key, (count, error)
+                in heapq.nlargest(k, self.counts.items(), key=lambda item: item[1][0])]
+
+    @classmethod
+    def merge(cls, summaries, capacity=None):
+        """Add summaries up. A key missing from one of them may still have
+        occurred up to that summary's floor times, which its error absorbs.
+        With `capacity`, only that many keys are kept."""
+        summaries = [summary for summary in summaries if summary.counts or summary.floor]
+        if len(summaries) == 1 and (capacity is None or len(summaries[0]) <= capacity):
+            return summaries[0]
+        floor = sum(summary.floor for summary in summaries)
+        counts = {}
+        for summary in summaries:
+            for key, (count, error) in summary.counts.items():
+                previous = counts.get(key)
+                counts[key] = (previous[0] + count, previous[1] + error) if previous else (count, error)
+        for summary in summaries:
+            if summary.floor:
+                for key, (count, error) in counts.items():
+                    if key not in summary.counts:
+                        counts[key] = (count + summary.floor, error + summary.floor)
+        if capacity is not None and len(counts) > capacity:
+            kept = heapq.nlargest(capacity + 1, counts.items(), key=lambda item: item[1][0])
+            floor = max(floor, kept.pop()[1][0])
+            counts = dict(kept)
+        return cls(counts, floor)
+
+class ExactCounts(dict):
+    def add(self, key):
+        self[key] = self.get(key, 0) + 1
+
+    @classmethod
+    def from_summary(cls, summary):
+        return cls((key, count) for key, (count, error) in summary.counts.items())
+
+    def summary(self):
+        return Summary({key: (count, 0) for key, count in self.copy().items()})
+
+class SpaceSaving:
+    """Space-Saving heavy hitters (Metwally et al.) in at most `capacity`
+    counters, with O(1) updates.
+
+    An unmonitored key takes over a counter with the smallest count, which
+    becomes its error. After n additions every count is at most n/capacity
+    too high, and any key occurring more than n/capacity times is monitored.
+    Keys with error 0 have been counted exactly since their first
+    occurrence: with a capacity well above the number of busy IPs, the top
+    tier is exact."""
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.counters = {}  # key -> [count, error]
+        self.buckets = {}  # count -> keys with that count (a dict used as an ordered set)
+        self.low = 0  # Smallest monitored count
+
+    def add(self, key):
+        counter = self.counters.get(key)
+        if counter is None:
+            if len(self.counters) < self.capacity:
+                counter = self.counters[key] = [0, 0]
+                self.low = 0
+            else:
+                victims = self.buckets[self.low]
+                victim = next(iter(victims))
+                del victims[victim]
+                if not victims:
+                    del self.buckets[self.low]
+                del self.counters[victim]
+                counter = self.counters[key] = [self.low, self.low]
+        else:
+            keys = self.buckets[counter[0]]
+            del keys[key]
+            if not keys:
+                del self.buckets[counter[0]]
+        count = counter[0] = counter[0] + 1
+        self.buckets.setdefault(count, {})[key] = None
+        if self.low not in self.buckets:
+            self.low = count  # Its bucket emptied into count, so nothing is lower
+
+    @classmethod
+    def from_summary(cls, summary, capacity):
+        """Counters resuming from `summary`, e.g. one saved to disk; its
+        highest `capacity` counts are kept"""
+        counts = cls(capacity)
+        for key, (count, error) in heapq.nlargest(capacity, summary.counts.items(), key=lambda item: item[1][0]):
+            counts.counters[key] = [count, error]
+            counts.buckets.setdefault(count, {})[key] = None
+        counts.low = min(counts.buckets, default=0)
+        return counts
+
+    def summary(self):
+        # dict.copy() runs without releasing the GIL: a consistent key set
+        # even while the owning thread keeps adding
+        counts = {key: tuple(counter) for key, counter in self.counters.copy().items()}
+        full = len(counts) >= self.capacity
+        return Summary(counts, self.low if full else 0)
+
+def new_counts(summary=None):
+    """Counts for the IP_COUNTS mode, starting from `summary` if given"""
+    if summary is None:
+        return SpaceSaving(IP_SUMMARY_SIZE) if IP_COUNTS == 'topk' else ExactCounts()
+    if IP_COUNTS == 'topk':
+        return SpaceSaving.from_summary(summary, IP_SUMMARY_SIZE)
+    return ExactCounts.from_summary(summary)
+
+class ShardedCounter:
+    """Per-key counts in a fixed pool of IP_COUNT_SHARDS shards, each
+    behind its own lock.
+
+    A thread is given a shard, round-robin, the first time it counts, so
+    concurrent threads rarely wait on one another; reads merge the shards.
+    The pool does not grow with the number of threads, even when the
+    server starts one per request."""
+
+    def __init__(self):
+        self.local = threading.local()
+        self.shards = [(threading.Lock(), new_counts()) for _ in range(max(1, IP_COUNT_SHARDS))]
+        self.assigned = itertools.count()
+        self.capacity = IP_SUMMARY_SIZE if IP_COUNTS == 'topk' else None
+        # Counts known at startup (e.g. loaded from disk); local to this
+        # process, never pushed to the aggregator
+        self.baseline = new_counts()
+
+    def add(self, key):
+        try:
+            lock, counts = self.local.shard
+        except AttributeError:
+            # next() on itertools.count is atomic under the GIL
+            lock, counts = self.local.shard = self.shards[next(self.assigned) % len(self.shards)]
+        with lock:
+            counts.add(key)
+
+    def live(self):
+        """Merged counts added since startup"""
+        summaries = []
+        for lock, counts in self.shards:
+            with lock:
+                summaries.append(counts.summary())
+        return Summary.merge(summaries, self.capacity)
+
+    def summary(self):
+        return Summary.merge([self.live(), self.baseline.summary()], self.capacity)
+
+class _Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        message = json.loads(self.rfile.readline())
+        aggregator = self.server.aggregator
+        if 'put' in message:
+            stored = aggregator.store(message)
+            self.wfile.write(b'{}\n' if stored else b'{"resend": true}\n')
+        else:
+            summary = aggregator.served()
+            self.wfile.write(json.dumps({'counts': summary.counts, 'floor': summary.floor}).encode() + b'\n')
+
+class _Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+class Aggregator:
+    """One count view across the worker processes sharing `path`.
+
+    The first process to bind the unix socket serves the merged view; the
+    others send it the counts changed since their previous push every
+    AGGREGATOR_INTERVAL seconds, and once more before each read so that a
+    read includes everything its own process has counted. The serving process saves the last counts of every
+    process, its own included, to `<path>.counts` at the same interval, so
+    restarted workers are not forgotten. When the serving process goes
+    away, another one takes over from that file."""
+
+    def __init__(self, counter, path=AGGREGATOR_SOCKET):
+        self.counter = counter
+        self.path = path
+        self.lock = threading.Lock()
+        self.server = None
+        self.processes = {}  # pid -> last Summary pushed by that process
+        self.versions = {}  # pid -> number of that process's last push
+        self.pushed = None  # Summary of this process as last acknowledged
+        self.version = 0
+        self.push_lock = threading.Lock()  # Pushes of the timer and of reads take turns
+        self.serve_or_connect()
+        threading.Thread(target=self.run, name='aggregator', daemon=True).start()
+
+    def serve_or_connect(self):
+        # Processes take turns through a lock file: otherwise one could
+        # remove the socket another one has just bound as stale
+        with open(f'{self.path}.lock', 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                self.request({'get': True})
+                return  # Someone else serves
+            except (OSError, ValueError):
+                pass
+            try:
+                os.unlink(self.path)  # Stale socket file of a process that has exited
+            except FileNotFoundError:
+                pass
+            try:
+                server = _Server(self.path, _Handler)
+            except OSError as e:
+                print(f"Error binding {self.path}: {e}", file=sys.stderr)
+                return  # Retried on the next sync
+        with self.lock:
+            self.processes = {pid: summary for pid, summary in self.load().items() if pid != os.getpid()}
+        server.aggregator = self
+        self.server = server
+        threading.Thread(target=server.serve_forever, name='aggregator-server', daemon=True).start()
+
+    def load(self):
+        """Counts saved by the previous serving process"""
+        try:
+            with open(f'{self.path}.counts') as f:
+                saved = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        return {
+            int(pid): Summary({key: tuple(value) for key, value in entry['counts'].items()}, entry['floor'])
+            for pid, entry in saved.items()
+        }
+
+    def save(self):
+        with self.lock:
+            processes = dict(self.processes)
+        processes[os.getpid()] = self.counter.live()
+        saved = {pid: {'counts': summary.counts, 'floor': summary.floor} for pid, summary in processes.items()}
+        temporary = f'{self.path}.counts.{os.getpid()}.tmp'
+        with open(temporary, 'w') as f:
+            json.dump(saved, f)
+        os.replace(temporary, f'{self.path}.counts')
+
+    def store(self, message):
+        """Apply a push: a full summary, or the changes since the push
+        numbered `since`. False when that push is not the last one known
+        (e.g. after a takeover): the sender then pushes everything again."""
+        pid, since = message['put'], message['since']
+        changed = {key: tuple(value) for key, value in message['counts'].items()}
+        with self.lock:
+            if since is None:
+                counts = changed
+            elif self.versions.get(pid) == since:
+                counts = dict(self.processes[pid].counts)
+                counts.update(changed)
+                for key in message['removed']:
+                    counts.pop(key, None)
+            else:
+                return False
+            self.processes[pid] = Summary(counts, message['floor'])
+            self.versions[pid] = message['version']
+        return True
+
+    def served(self):
+        with self.lock:
+            others = [summary for pid, summary in self.processes.items() if pid != os.getpid()]
+        return Summary.merge([self.counter.summary(), *others], self.counter.capacity)
+
+    def request(self, message):
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.settimeout(5)
+            sock.connect(self.path)
+            sock.sendall(json.dumps(message).encode() + b'\n')
+            with sock.makefile('rb') as reply:
+                line = reply.readline()
+        if not line:
+            raise ConnectionError('aggregator closed the connection')
+        return json.loads(line)
+
+    def push(self):
+        """Send the counts changed since the last acknowledged push, or all
+        of them when the aggregator does not know that push"""
+        if self.server is not None:
+            return
+        with self.push_lock:
+            if not self.push_changes():
+                self.pushed = None
+                self.push_changes()
+
+    def push_changes(self):
+        """True when the aggregator applied the push"""
+        summary = self.counter.live()
+        message = {'put': os.getpid(), 'version': self.version + 1, 'floor': summary.floor}
+        previous = self.pushed
+        if previous is None:
+            message.update(since=None, counts=summary.counts, removed=[])
+        else:
+            message.update(
+                since=self.version,
+                counts={key: value for key, value in summary.counts.items() if previous.counts.get(key) != value},
+                # Keys a top-k summary has evicted
+                removed=[key for key in previous.counts if key not in summary.counts],
+            )
+        if self.request(message).get('resend'):
+            return False
+        self.pushed = summary
+        self.version += 1
+        return True
+
+    def run(self):
+        while True:
+            time.sleep(AGGREGATOR_INTERVAL)
+            self.sync()
+            if self.server is not None:
+                try:
+                    self.save()
+                except OSError as e:
+                    print(f"Error saving {self.path}.counts: {e}", file=sys.stderr)
+
+    def sync(self):
+        try:
+            self.push()
+        except (OSError, ValueError):
+            self.serve_or_connect()
+
+    def summary(self):
+        """Counts of all processes; this process's own counts when no
+        aggregator can be reached"""
+        self.sync()
+        if self.server is not None:
+            return self.served()
+        try:
+            reply = self.request({'get': True})
+        except (OSError, ValueError):
+            return self.counter.summary()
+        return Summary({key: tuple(value) for key, value in reply['counts'].items()}, reply['floor'])
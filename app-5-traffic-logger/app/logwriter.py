@@ -0,0 +1,83 @@
+import os
+import sys
+import time
+import queue
+import atexit
+import threading
+
+# Records waiting to be written; when full, new records are dropped (and
+# counted) unless LOG_QUEUE_FULL=block, which makes requests wait instead
+LOG_QUEUE_SIZE = int(os.environ.get('LOG_QUEUE_SIZE', '10000'))
+LOG_QUEUE_FULL = os.environ.get('LOG_QUEUE_FULL', 'drop')
+# A batch is written when it reaches LOG_BATCH_SIZE records or
+# LOG_FLUSH_INTERVAL seconds after its first record, whichever comes first
+LOG_BATCH_SIZE = int(os.environ.get('LOG_BATCH_SIZE', '500'))
+LOG_FLUSH_INTERVAL = float(os.environ.get('LOG_FLUSH_INTERVAL', '0.5'))
+
+_STOP = object()
+
+class LogWriter:
+    """Writes log records from a background thread, in batches.
+
+    Requests only enqueue their record; each handler is called with a list
+    of records, so stdout and the disk see one write per batch."""
+
+    def __init__(self, *handlers):
+        self.handlers = handlers
+        self.queue = queue.Queue(LOG_QUEUE_SIZE)
+        self.block = LOG_QUEUE_FULL == 'block'
+        self.written = 0
+        self.dropped = 0
+        self.reported_drops = 0
+        self.thread = threading.Thread(target=self.run, name='log-writer', daemon=True)
+        self.thread.start()
+        atexit.register(self.close)
+
+    def put(self, record):
+        if self.block:
+            self.queue.put(record)
+            return
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def run(self):
+        while True:
+            record = self.queue.get()
+            if record is _STOP:
+                return
+            batch = [record]
+            deadline = time.monotonic() + LOG_FLUSH_INTERVAL
+            while len(batch) < LOG_BATCH_SIZE:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    record = self.queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                if record is _STOP:
+                    self.flush(batch)
+                    return
+                batch.append(record)
+            self.flush(batch)
+
+    def flush(self, batch):
+        for handler in self.handlers:
+            try:
+                handler(batch)
+            except Exception as e:
+                print(f"Error writing logs: {e}", file=sys.stderr)
+        self.written += len(batch)
+        if self.dropped > self.reported_drops:
+            print(f"Log queue full: dropped {self.dropped - self.reported_drops} records", file=sys.stderr)
+            self.reported_drops = self.dropped
+
+    def close(self, timeout=5):
+        """Write what is queued, then stop the thread"""
+        try:
+            self.queue.put(_STOP, timeout=timeout)
+        except queue.Full:
+            return
+        self.thread.join(timeout)
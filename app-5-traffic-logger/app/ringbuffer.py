@@ -0,0 +1,74 @@
+import threading
+
+class RequestRecord:
+    """One logged request. Slotted: no per-instance dict."""
+
+    __slots__ = ('timestamp', 'ip', 'method', 'path', 'user_agent', 'referer', 'query_string')
+
+    def __init__(self, timestamp, ip, method, path, user_agent, referer, query_string):
+        self.timestamp = timestamp
+        self.ip = ip
+        self.method = method
+        self.path = path
+        self.user_agent = user_agent
+        self.referer = referer
+        self.query_string = query_string
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+class RingBuffer:
+    """Fixed-capacity log keeping the most recent `capacity` items.
+
+    The slot list is allocated once; appending overwrites the oldest slot, so
+    it costs the same at any capacity. Items are numbered by a global
+    sequence (0 for the first ever appended)."""
+
+    def __init__(self, capacity):
+        if capacity < 1:
+            raise ValueError('capacity must be at least 1')
+        self.capacity = capacity
+        self.slots = [None] * capacity  # (sequence, item)
+        self.lock = threading.Lock()
+        self.total = 0  # Items ever appended
+
+    def append(self, item):
+        # The slot and the count change together; readers only take the
+        # count, and check each slot's sequence
+        with self.lock:
+            index = self.total
+            self.slots[index % self.capacity] = (index, item)
+            self.total = index + 1
+
+    def __len__(self):
+        return min(self.total, self.capacity)
+
+    def __bool__(self):
+        return self.total > 0
+
+    def __iter__(self):
+        """Oldest to newest"""
+        end = self.total
+        for index in range(max(0, end - self.capacity), end):
+            entry = self.slots[index % self.capacity]
+            if entry is not None and entry[0] == index:
+                yield entry[1]
+
+    def __reversed__(self):
+        """Newest to oldest"""
+        for index, item in self.entries():
+            yield item
+
+    def entries(self, before=None):
+        """(sequence, item) pairs from newest to oldest, starting below the
+        sequence `before`, read in place without copying the buffer. Items
+        appended during the iteration are not included; it stops early when
+        the buffer wraps past the items still to be read."""
+        end = self.total if before is None else min(before, self.total)
+        for index in range(end - 1, max(0, end - self.capacity) - 1, -1):
+            entry = self.slots[index % self.capacity]
+            if entry is None:
+                continue
+            if entry[0] != index:
+                return  # Its slot now holds a newer item
+            yield entry
@@ -1,42 +1,80 @@
-from flask import Flask, request, render_template
+from flask import Flask, Response, request, render_template, jsonify, stream_with_context, url_for
 from datetime import datetime
-from collections import defaultdict
+from itertools import islice
 import os
-import json
+import sys
+import threading
+import archive
+import snapshot
+from segments import SegmentWriter
+from logwriter import LogWriter
+from counters import AGGREGATOR_SOCKET, IP_COUNTS, Aggregator, ShardedCounter
+from index import RequestIndex
 
 app = Flask(__name__)
 
-# Store requests in memory (no limit)
-requests_log = []
-ip_counts = defaultdict(int)
+# Store requests in memory (no limit), indexed for the /requests filters
+request_index = RequestIndex()
+# Sharded counters, merged when /ips is read; with AGGREGATOR_SOCKET set,
+# the counts of all worker processes are merged through it
+ip_counts = ShardedCounter()
 
-# Log file path
-LOG_FILE = '/captures/requests.jsonl'
+# Rows per page on /requests and /api/requests (?limit=, up to MAX_PAGE_SIZE)
+PAGE_SIZE = int(os.environ.get('PAGE_SIZE', '100'))
+MAX_PAGE_SIZE = int(os.environ.get('MAX_PAGE_SIZE', '1000'))
+# Rendered template pieces sent per chunk of a streamed page
+STREAM_BUFFER = int(os.environ.get('STREAM_BUFFER', '50'))
 
-def save_request_to_file(request_data):
-    """Save request to JSONL file"""
+# Rows shown on /ips, busiest first
+IP_TOP_K = int(os.environ.get('IP_TOP_K', '1000'))
+
+# Requests are written to rotated, compressed segments under LOG_DIR
+segment_writer = SegmentWriter()
+
+def save_requests_to_file(batch):
+    """Append a batch of requests to this process's log segment"""
     try:
-        with open(LOG_FILE, 'a') as f:
-            f.write(json.dumps(request_data) + '\n')
+        segment_writer.write(batch)
     except Exception as e:
         print(f"Error saving to file: {e}")
 
-def load_requests_from_file():
-    """Load requests from JSONL file"""
-    global requests_log, ip_counts
-    if os.path.exists(LOG_FILE):
-        try:
-            with open(LOG_FILE, 'r') as f:
-                for line in f:
-                    if line.strip():
-                        req = json.loads(line)
-                        requests_log.append(req)
-                        ip_counts[req['ip']] += 1
-        except Exception as e:
-            print(f"Error loading from file: {e}")
-
-# Load existing requests on startup
-load_requests_from_file()
+def print_requests(batch):
+    """Console lines for a batch of logged requests"""
+    sys.stdout.write(''.join(
+        f"[{r['timestamp']}] {r['ip']} - {r['scheme'].upper()} {r['method']} {r['path']}\n" for r in batch
+    ))
+    sys.stdout.flush()
+
+def restore_history(history):
+    """Put the requests and IP counts loaded from disk behind the live ones"""
+    index = RequestIndex()
+    for req in history.recent:
+        index.add(req)
+    request_index.prepend(index)
+    # Loaded by every worker process: kept out of the pushed counts
+    ip_counts.baseline = history.counts
+    history_loaded.set()
+
+history_loaded = threading.Event()
+ip_view = ip_counts
+# Column files of the sealed segments, for historical queries (?source=archive)
+request_archive = archive.Archive()
+
+# With debug=True, `python app.py` also runs this module in the reloader's
+# parent process, which only watches the files: the threads writing the
+# log, the snapshot and the archive start in the process serving requests
+SERVING = __name__ != '__main__' or os.environ.get('WERKZEUG_RUN_MAIN') == 'true'
+
+if SERVING:
+    # Console and file output are written in batches by a background thread
+    log_writer = LogWriter(print_requests, save_requests_to_file)
+    # Load existing requests in the background from the last snapshot and
+    # the lines written after it, while requests are already served
+    threading.Thread(target=snapshot.run, args=(snapshot.startup_limits(), restore_history),
+                     name='history', daemon=True).start()
+    if AGGREGATOR_SOCKET:
+        ip_view = Aggregator(ip_counts)
+    threading.Thread(target=archive.run, name='archive', daemon=True).start()
 
 @app.before_request
 def log_request():
@@ -60,51 +98,128 @@ def log_request():
         'content_length': request.headers.get('Content-Length', '0'),
     }
     
-    requests_log.append(request_data)
-    ip_counts[ip_address] += 1
-    save_request_to_file(request_data)
-    
-    print(f"[{timestamp}] {ip_address} - {request.scheme.upper()} {request.method} {request.path}")
+    request_index.add(request_data)
+    ip_counts.add(ip_address)
+    log_writer.put(request_data)
 
 @app.route('/')
 def index():
     """Main page with links to all views"""
     return render_template('index.html')
 
+def request_filters():
+    """Filter parameters of /requests and /api/requests"""
+    return {
+        'ip': request.args.get('ip', '').strip(),
+        'user_agent': request.args.get('ua', '').strip().lower(),
+        'method': request.args.get('method', '').strip().upper(),
+        'path': request.args.get('path', '').strip().lower(),
+    }
+
+def time_arg(name):
+    """Epoch seconds of a `since`/`until` parameter, e.g. '2024-01-31' or
+    '2024-01-31 12:00:00'"""
+    value = request.args.get(name, '').strip()
+    try:
+        return int(datetime.fromisoformat(value).timestamp()) if value else None
+    except ValueError:
+        return None
+
+def page_args():
+    """Cursor (`before`: id of the last row already seen), offset and page
+    size of a paginated request"""
+    before = request.args.get('before')
+    offset = max(0, request.args.get('offset', 0, type=int))
+    limit = min(max(1, request.args.get('limit', PAGE_SIZE, type=int)), MAX_PAGE_SIZE)
+    return before, offset, limit
+
+def paginate(entries, offset, limit):
+    """One page of (id, item) pairs, newest first, and the cursor of the
+    next page (None on the last one)"""
+    page = list(islice(entries, offset, offset + limit + 1))
+    next_cursor = page[limit - 1][0] if len(page) > limit else None
+    return page[:limit], next_cursor
+
+def search_requests(filters, before):
+    """(id, record) of the matching requests newest first, the number of
+    requests and a function counting the matches. From the in-memory log,
+    or with ?source=archive from the column files, between `since` and
+    `until`."""
+    if request.args.get('source') == 'archive':
+        query = request_archive.query(**filters, since=time_arg('since'), until=time_arg('until'))
+        return query.newest(archive.parse_cursor(before)), len(request_archive), query.count
+    try:
+        before = int(before) if before is not None else None
+    except ValueError:
+        before = None
+    # Filter requests through the indexes
+    return (request_index.search(**filters, before=before), len(request_index),
+            lambda: request_index.count(**filters))
+
+def stream_page(template_name, **context):
+    """Render a template as a chunked response, so the first rows reach the
+    browser before the last ones are rendered"""
+    app.update_template_context(context)
+    stream = app.jinja_env.get_template(template_name).stream(context)
+    stream.enable_buffering(STREAM_BUFFER)
+    return Response(stream_with_context(stream), mimetype='text/html')
+
 @app.route('/requests')
 def all_requests():
-    """Display all individual requests with filters"""
-    # Get filter parameters
-    filter_ip = request.args.get('ip', '').strip()
-    filter_ua = request.args.get('ua', '').strip().lower()
-    filter_method = request.args.get('method', '').strip().upper()
-    filter_path = request.args.get('path', '').strip().lower()
+    """Display one page of individual requests with filters, newest first"""
+    filters = request_filters()
+    before, offset, limit = page_args()
+    entries, total, count = search_requests(filters, before)
+    page, next_cursor = paginate(entries, offset, limit)
+    query = {'ip': filters['ip'], 'ua': filters['user_agent'], 'method': filters['method'],
+             'path': filters['path'], 'source': request.args.get('source', ''),
+             'since': request.args.get('since', '').strip(), 'until': request.args.get('until', '').strip(),
+             'limit': limit}
+    query = {key: value for key, value in query.items() if value}
+    next_url = url_for('all_requests', **query, before=next_cursor) if next_cursor is not None else None
     
-    # Filter requests
-    filtered = requests_log
-    if filter_ip:
-        filtered = [r for r in filtered if filter_ip in r['ip']]
-    if filter_ua:
-        filtered = [r for r in filtered if filter_ua in r['user_agent'].lower()]
-    if filter_method:
-        filtered = [r for r in filtered if r['method'] == filter_method]
-    if filter_path:
-        filtered = [r for r in filtered if filter_path in r['path'].lower()]
-    
-    return render_template('requests.html', 
-                         requests=reversed(filtered), 
-                         total=len(requests_log),
-                         filtered_count=len(filtered),
-                         filter_ip=filter_ip,
-                         filter_ua=filter_ua,
-                         filter_method=filter_method,
-                         filter_path=filter_path)
+    return stream_page('requests.html',
+                       requests=page,
+                       total=total,
+                       filtered_count=count(),
+                       filter_ip=filters['ip'],
+                       filter_ua=filters['user_agent'],
+                       filter_method=filters['method'],
+                       filter_path=filters['path'],
+                       source=query.get('source', ''),
+                       since=query.get('since', ''),
+                       until=query.get('until', ''),
+                       limit=limit,
+                       query=query,
+                       next_cursor=next_cursor,
+                       next_url=next_url,
+                       loading=not history_loaded.is_set() and 'source' not in query)
+
+@app.route('/api/requests')
+def api_requests():
+    """One page of filtered requests as JSON; pass `next` back as `before`
+    for the following page"""
+    filters = request_filters()
+    before, offset, limit = page_args()
+    entries, total, count = search_requests(filters, before)
+    page, next_cursor = paginate(entries, offset, limit)
+    return jsonify(requests=[dict(record, id=record_id) for record_id, record in page],
+                   next=next_cursor, total=total)
 
 @app.route('/ips')
 def unique_ips():
     """Display unique IPs and their request counts"""
-    sorted_ips = sorted(ip_counts.items(), key=lambda x: x[1], reverse=True)
-    return render_template('ips.html', ips=sorted_ips, total_unique=len(sorted_ips))
+    source = request.args.get('source', '')
+    since = request.args.get('since', '').strip()
+    until = request.args.get('until', '').strip()
+    if source == 'archive':
+        summary = request_archive.ip_summary(time_arg('since'), time_arg('until'))
+    else:
+        summary = ip_view.summary()
+    return render_template('ips.html', ips=summary.top(IP_TOP_K), total_unique=len(summary),
+                           approximate=IP_COUNTS == 'topk' and source != 'archive', floor=summary.floor,
+                           loading=not history_loaded.is_set() and source != 'archive',
+                           source=source, since=since, until=until)
 
 # Catch-all route to log any other requests (must be last)
 @app.route('/<path:path>', methods=['GET', 'POST', 'PUT', 'DELETE', 'PATCH', 'OPTIONS', 'HEAD'])
@@ -0,0 +1,420 @@
+import os
+import sys
+import glob
+import json
+import mmap
+import time
+import fcntl
+import heapq
+import bisect
+import socket
+import struct
+import ipaddress
+import threading
+from array import array
+from datetime import datetime
+from collections import Counter
+from operator import sub
+from itertools import chain, compress
+import segments
+from counters import Summary
+
+# Column files compacted from sealed log segments, queried through mmap
+ARCHIVE_DIR = os.environ.get('ARCHIVE_DIR', '/captures/archive')
+# Seconds between two compaction runs
+ARCHIVE_INTERVAL = float(os.environ.get('ARCHIVE_INTERVAL', '600'))
+
+MAGIC = b'REQCOL2\n'
+SUFFIX = '.col'
+TIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+# Dictionary-encoded string columns; the timestamp is stored as int64 epoch
+# seconds, rows sorted by it
+COLUMNS = ('ip', 'method', 'scheme', 'path', 'query_string', 'user_agent', 'referer', 'content_length')
+
+# bytes.translate table swapping 0 and 1
+INVERT = bytes([1, 0]).ljust(256, b'\0')
+
+def code_type(values):
+    """Narrowest array type holding codes for `values` distinct values"""
+    return 'B' if values <= 1 << 8 else 'H' if values <= 1 << 16 else 'I'
+
+def write(path, records):
+    """Write `records` as a column file, atomically.
+
+    Layout: MAGIC, a uint32 header length, a JSON header, then 8-byte
+    aligned sections: the int64 epochs, and for each column its codes,
+    the uint32 offsets of its values, the UTF-8 values themselves, and
+    its postings: the uint32 rows of each value in ascending order, value
+    after value, with the uint32 position where each value's rows start.
+    Section offsets in the header are relative to the end of the header."""
+    epochs = array('q')
+    codes = {name: array('I') for name in COLUMNS}
+    dictionaries = {name: {} for name in COLUMNS}
+    parsed = {}  # timestamp -> epoch; a second's requests share it
+    for req in records:
+        timestamp = req.get('timestamp', '')
+        epoch = parsed.get(timestamp)
+        if epoch is None:
+            try:
+                epoch = int(datetime.strptime(timestamp, TIME_FORMAT).timestamp())
+            except ValueError:
+                epoch = 0
+            parsed[timestamp] = epoch
+        epochs.append(epoch)
+        for name in COLUMNS:
+            dictionary = dictionaries[name]
+            value = str(req.get(name, ''))
+            code = dictionary.get(value)
+            if code is None:
+                code = dictionary[value] = len(dictionary)
+            codes[name].append(code)
+    order = sorted(range(len(epochs)), key=epochs.__getitem__)
+    sections = [array('q', map(epochs.__getitem__, order)).tobytes()]
+    header = {'rows': len(epochs), 'first': min(epochs, default=0), 'last': max(epochs, default=0), 'columns': {}}
+    position = len(sections[0])
+    def add(data):
+        nonlocal position
+        padding = -position % 8
+        sections.append(b'\0' * padding + data)
+        position += padding
+        offset = position
+        position += len(data)
+        return offset
+    for name in COLUMNS:
+        values = [value.encode('utf-8', 'surrogatepass') for value in dictionaries[name]]
+        typecode = code_type(len(values))
+        offsets = array('I', [0])
+        for value in values:
+            offsets.append(offsets[-1] + len(value))
+        column = array(typecode, map(codes[name].__getitem__, order))
+        # Stable sort: the rows of a value stay in time order
+        postings = array('I', sorted(range(len(column)), key=column.__getitem__))
+        starts = array('I', [0] * (len(values) + 1))
+        for code in column:
+            starts[code + 1] += 1
+        for code in range(len(values)):
+            starts[code + 1] += starts[code]
+        header['columns'][name] = {
+            'type': typecode,
+            'values': len(values),
+            'codes': add(column.tobytes()),
+            'offsets': add(offsets.tobytes()),
+            'data': add(b''.join(values)),
+            'postings': add(postings.tobytes()),
+            'starts': add(starts.tobytes()),
+        }
+    encoded = json.dumps(header).encode()
+    encoded += b' ' * (-(len(MAGIC) + 4 + len(encoded)) % 8)
+    temporary = f'{path}.{os.getpid()}.tmp'
+    with open(temporary, 'wb') as f:
+        f.write(MAGIC + struct.pack('<I', len(encoded)) + encoded)
+        f.writelines(sections)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temporary, path)
+
+def ip_predicate(query):
+    """IPs in the network `query` (when it contains a `/`) or starting with it"""
+    if '/' not in query:
+        return lambda value: value.startswith(query)
+    try:
+        network = ipaddress.ip_network(query, strict=False)
+    except ValueError:
+        return lambda value: False
+    family = socket.AF_INET if network.version == 4 else socket.AF_INET6
+    address, netmask = int(network.network_address), int(network.netmask)
+    def in_network(value):
+        # inet_pton is several times faster than ipaddress.ip_address()
+        try:
+            return int.from_bytes(socket.inet_pton(family, value), 'big') & netmask == address
+        except (OSError, ValueError):
+            return False
+    return in_network
+
+def predicates(ip='', user_agent='', method='', path=''):
+    """(column, predicate on a value) of each given filter, with the
+    semantics of the in-memory index"""
+    checks = []
+    if ip:
+        checks.append(('ip', ip_predicate(ip)))
+    if method:
+        checks.append(('method', lambda value: value == method))
+    if user_agent:
+        checks.append(('user_agent', lambda value: user_agent in value.lower()))
+    if path:
+        checks.append(('path', lambda value: path in value.lower()))
+    return checks
+
+class ColumnFile:
+    """A column file mapped in memory; columns are memoryviews over the map,
+    so queries never parse rows into records"""
+
+    def __init__(self, path):
+        self.path = path
+        self.name = os.path.basename(path)[:-len(SUFFIX)]
+        with open(path, 'rb') as f:
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(self.map)
+        if view[:len(MAGIC)] != MAGIC:
+            raise ValueError(f'{path} is not a column file')
+        length = struct.unpack_from('<I', self.map, len(MAGIC))[0]
+        start = len(MAGIC) + 4
+        header = json.loads(bytes(view[start:start + length]))
+        base = start + length
+        self.rows = header['rows']
+        self.first = header['first']
+        self.last = header['last']
+        self.epochs = view[base:base + 8 * self.rows].cast('q')
+        self.columns = {}
+        self.postings = {}
+        for name, column in header['columns'].items():
+            width = array(column['type']).itemsize
+            codes = view[base + column['codes']:base + column['codes'] + width * self.rows].cast(column['type'])
+            offsets = view[base + column['offsets']:base + column['offsets'] + 4 * (column['values'] + 1)].cast('I')
+            data = view[base + column['data']:base + column['data'] + offsets[-1]]
+            postings = view[base + column['postings']:base + column['postings'] + 4 * self.rows].cast('I')
+            starts = view[base + column['starts']:base + column['starts'] + 4 * (column['values'] + 1)].cast('I')
+            self.columns[name] = (codes, offsets, data)
+            self.postings[name] = (postings, starts)
+        self.dictionaries = {}
+
+    def dictionary(self, name):
+        """Distinct values of a column, decoded once"""
+        values = self.dictionaries.get(name)
+        if values is None:
+            codes, offsets, data = self.columns[name]
+            values = self.dictionaries[name] = [
+                bytes(data[offsets[i]:offsets[i + 1]]).decode('utf-8', 'surrogatepass')
+                for i in range(len(offsets) - 1)
+            ]
+        return values
+
+    def time_range(self, since=None, until=None):
+        """Row slice of the epochs in [since, until]"""
+        lo = 0 if since is None else bisect.bisect_left(self.epochs, since)
+        hi = self.rows if until is None else bisect.bisect_right(self.epochs, until)
+        return lo, max(lo, hi)
+
+    def rows_of(self, name, code, lo, hi):
+        """Rows of [lo, hi) holding value `code` of a column, ascending"""
+        postings, starts = self.postings[name]
+        start, end = starts[code], starts[code + 1]
+        if lo > 0:
+            start = bisect.bisect_left(postings, lo, start, end)
+        if hi < self.rows:
+            end = bisect.bisect_left(postings, hi, start, end)
+        return postings[start:end]
+
+    def mask(self, checks, lo, hi):
+        """One byte per row of [lo, hi), 1 where every check holds on the
+        row's value; None when all rows match. Checks run on the distinct
+        values. For 1-byte codes the rows are mapped through them by
+        bytes.translate; for wider ones the postings of the matching values,
+        or of the others when they have fewer rows, are marked. Columns are
+        combined with a big-integer AND."""
+        mask = None
+        for name, check in checks:
+            table = bytes(1 if check(value) else 0 for value in self.dictionary(name))
+            if 1 not in table:
+                return bytes(hi - lo)
+            if 0 not in table:
+                continue
+            codes = self.columns[name][0]
+            if codes.format == 'B':
+                column = codes[lo:hi].tobytes().translate(table.ljust(256, b'\0'))
+            else:
+                column = self.mark(name, table, lo, hi)
+            if mask is None:
+                mask = column
+            else:
+                mask = (int.from_bytes(mask, 'little') & int.from_bytes(column, 'little')).to_bytes(hi - lo, 'little')
+        return mask
+
+    def mark(self, name, table, lo, hi):
+        """Mask of the rows of [lo, hi) whose code is 1 in `table`, set from
+        the postings of the side of the split with fewer rows, or by a
+        lookup per row when the range has fewer rows still"""
+        _, starts = self.postings[name]
+        matched = list(compress(range(len(table)), table))
+        matching = sum(starts[code + 1] - starts[code] for code in matched)
+        if hi - lo <= min(matching, self.rows - matching):
+            return bytes(map(table.__getitem__, self.columns[name][0][lo:hi]))
+        if 2 * matching <= self.rows:
+            flag, column = 1, bytearray(hi - lo)
+        else:
+            flag, column = 0, bytearray(b'\1') * (hi - lo)
+            matched = compress(range(len(table)), table.translate(INVERT))
+        for code in matched:
+            for row in self.rows_of(name, code, lo, hi):
+                column[row - lo] = flag
+        return column
+
+    def record(self, row):
+        req = {'timestamp': datetime.fromtimestamp(self.epochs[row]).strftime(TIME_FORMAT)}
+        for name in COLUMNS:
+            req[name] = self.dictionary(name)[self.columns[name][0][row]]
+        return req
+
+    def ip_counts(self, lo, hi):
+        """IP -> requests in rows [lo, hi), from the lengths of the IPs'
+        postings. Rows are counted one by one instead when fewer of them are
+        in the range, or left out of it, than there are IPs."""
+        values = self.dictionary('ip')
+        codes = self.columns['ip'][0]
+        if hi - lo < len(values):
+            return {values[code]: n for code, n in Counter(codes[lo:hi]).items()}
+        _, starts = self.postings['ip']
+        if lo + self.rows - hi < len(values):
+            counts = array('I', map(sub, starts[1:], starts[:-1]))
+            for code in chain(codes[:lo], codes[hi:]):
+                counts[code] -= 1
+            return {value: n for value, n in zip(values, counts) if n}
+        counts = {}
+        for code, value in enumerate(values):
+            n = len(self.rows_of('ip', code, lo, hi))
+            if n:
+                counts[value] = n
+        return counts
+
+class Query:
+    """Filtered rows of the column files, with each file's mask computed at
+    most once and only when needed"""
+
+    def __init__(self, files, checks, since=None, until=None):
+        self.files = files
+        self.checks = checks
+        self.since = since
+        self.until = until
+        self.masks = {}
+
+    def matches(self, column_file):
+        """(lo, hi, mask) of a file; see ColumnFile.mask"""
+        result = self.masks.get(column_file.name)
+        if result is None:
+            lo, hi = column_file.time_range(self.since, self.until)
+            result = self.masks[column_file.name] = (lo, hi, column_file.mask(self.checks, lo, hi))
+        return result
+
+    def count(self):
+        total = 0
+        for column_file in self.files:
+            lo, hi, mask = self.matches(column_file)
+            total += hi - lo if mask is None else mask.count(1)
+        return total
+
+    def rows(self, column_file, before):
+        """(epoch, file name, row) of a file's matches, newest first, below
+        the cursor `before`"""
+        lo, hi, mask = self.matches(column_file)
+        end = hi if before is None else bisect.bisect_right(column_file.epochs, before[0], lo, hi)
+        rows = range(end - 1, lo - 1, -1)
+        if mask is not None:
+            rows = compress(rows, mask[:end - lo][::-1])
+        epochs, name = column_file.epochs, column_file.name
+        for row in rows:
+            key = (epochs[row], name, row)
+            if before is None or key < before:
+                yield key
+
+    def newest(self, before=None):
+        """(cursor, record) of the matching rows, newest first. Files are
+        only scanned once the merge reaches their time range."""
+        files = {column_file.name: column_file for column_file in self.files}
+        rank = {name: i for i, name in enumerate(sorted(files))}
+        pending = sorted(self.files, key=lambda f: f.last)
+        heap = []
+        def advance(rows):
+            for epoch, name, row in rows:
+                heapq.heappush(heap, (-epoch, -rank[name], -row, name, rows))
+                return
+        while True:
+            while pending and (not heap or pending[-1].last >= -heap[0][0]):
+                advance(self.rows(pending.pop(), before))
+            if not heap:
+                return
+            epoch, _, row, name, rows = heapq.heappop(heap)
+            yield f'{-epoch}:{-row}:{name}', files[name].record(-row)
+            advance(rows)
+
+def parse_cursor(cursor):
+    """(epoch, file name, row) of a cursor from Query.newest, or None"""
+    try:
+        epoch, row, name = cursor.split(':', 2)
+        return int(epoch), name, int(row)
+    except (AttributeError, ValueError):
+        return None
+
+class Archive:
+    """The column files of ARCHIVE_DIR, mapped once and picked up as
+    compaction adds them"""
+
+    def __init__(self, directory=ARCHIVE_DIR):
+        self.directory = directory
+        self.files = {}
+        self.lock = threading.Lock()
+
+    def refresh(self):
+        with self.lock:
+            for path in glob.glob(os.path.join(self.directory, '*' + SUFFIX)):
+                name = os.path.basename(path)[:-len(SUFFIX)]
+                if name not in self.files:
+                    try:
+                        self.files[name] = ColumnFile(path)
+                    except (OSError, ValueError) as e:
+                        print(f"Error opening {path}: {e}", file=sys.stderr)
+            return [self.files[name] for name in sorted(self.files)]
+
+    def __len__(self):
+        return sum(column_file.rows for column_file in self.refresh())
+
+    def query(self, ip='', user_agent='', method='', path='', since=None, until=None):
+        return Query(self.refresh(), predicates(ip, user_agent, method, path), since, until)
+
+    def ip_summary(self, since=None, until=None):
+        """Exact IP counts of the archived requests in [since, until]"""
+        counts = Counter()
+        for column_file in self.refresh():
+            counts.update(column_file.ip_counts(*column_file.time_range(since, until)))
+        return Summary({ip: (n, 0) for ip, n in counts.items()})
+
+def current(path):
+    """Whether `path` is a column file in the current format"""
+    try:
+        with open(path, 'rb') as f:
+            return f.read(len(MAGIC)) == MAGIC
+    except OSError:
+        return False
+
+def compact(directory=ARCHIVE_DIR, wait=True):
+    """Write a column file for every sealed segment, and for the log file
+    from before segments, that has none yet or one in an older format.
+    Returns the files written, or None when another process is compacting
+    and `wait` is false."""
+    os.makedirs(directory, exist_ok=True)
+    written = []
+    with open(os.path.join(directory, '.lock'), 'a') as lock:
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX if wait else fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return None
+        for segment in segments.segments():
+            if not segment.sealed and segment.path != segments.LOG_FILE:
+                continue  # Still being written
+            path = os.path.join(directory, segment.name + SUFFIX)
+            if not current(path):
+                write(path, segment.records())
+                written.append(path)
+    return written
+
+def run():
+    """Compact every ARCHIVE_INTERVAL seconds"""
+    while True:
+        time.sleep(ARCHIVE_INTERVAL)
+        try:
+            compact(wait=False)
+        except Exception as e:
+            print(f"Error compacting: {e}", file=sys.stderr)
+
+if __name__ == '__main__':
+    for path in compact():
+        print(path)
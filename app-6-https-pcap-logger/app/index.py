@@ -0,0 +1,225 @@
+import heapq
+import bisect
+import ipaddress
+import threading
+from array import array
+
+# Length of the substrings indexed for path and user-agent search
+NGRAM = 3
+
+class Column:
+    """Dictionary-encoded column: each distinct value gets an id, and keeps
+    the posting list (ascending record positions) of the records holding it"""
+
+    def __init__(self):
+        self.ids = {}  # value -> value id
+        self.values = []  # value id -> value
+        self.postings = []  # value id -> record positions
+        self.codes = array('I')  # record position -> value id
+
+    def add(self, position, value):
+        """Returns the value id, and whether the value is new"""
+        value_id = self.ids.get(value)
+        new = value_id is None
+        if new:
+            value_id = self.ids[value] = len(self.values)
+            self.values.append(value)
+            self.postings.append([])
+        self.postings[value_id].append(position)
+        self.codes.append(value_id)
+        return value_id, new
+
+class NgramIndex:
+    """Case-insensitive substring search over the distinct values of a
+    column, through the n-grams of each value"""
+
+    def __init__(self, column):
+        self.column = column
+        self.grams = {}  # n-gram -> ascending value ids
+
+    def add(self, value_id, value):
+        value = value.lower()
+        for gram in {value[i:i + NGRAM] for i in range(len(value) - NGRAM + 1)}:
+            self.grams.setdefault(gram, []).append(value_id)
+
+    def matching(self, needle):
+        """Ids of the values containing `needle` (already lowercased)"""
+        values = self.column.values
+        if len(needle) < NGRAM:
+            return {value_id for value_id, value in enumerate(values) if needle in value.lower()}
+        lists = []
+        for gram in {needle[i:i + NGRAM] for i in range(len(needle) - NGRAM + 1)}:
+            ids = self.grams.get(gram)
+            if not ids:
+                return set()
+            lists.append(ids)
+        lists.sort(key=len)
+        candidates = set(lists[0])
+        for ids in lists[1:]:
+            candidates.intersection_update(ids)
+            if not candidates:
+                return candidates
+        # Every n-gram present does not make a match: check the value
+        return {value_id for value_id in candidates if needle in values[value_id].lower()}
+
+class IpIndex:
+    """Prefix and CIDR lookups over the distinct IPs of a column. The sorted
+    views are rebuilt lazily, on the first lookup after new IPs appear."""
+
+    def __init__(self, column):
+        self.column = column
+        self.by_text = []  # (ip, value id), sorted
+        self.by_number = {4: [], 6: []}  # version -> (integer address, value id), sorted
+        self.pending = []
+
+    def add(self, value_id, value):
+        self.pending.append((value_id, value))
+
+    def refresh(self):
+        if not self.pending:
+            return
+        pending, self.pending = self.pending, []
+        for value_id, value in pending:
+            self.by_text.append((value, value_id))
+            try:
+                address = ipaddress.ip_address(value)
+            except ValueError:
+                continue  # Header-supplied garbage: only prefix searches find it
+            self.by_number[address.version].append((int(address), value_id))
+        self.by_text.sort()
+        for addresses in self.by_number.values():
+            addresses.sort()
+
+    def matching(self, query):
+        """Ids of the IPs in the network `query` (when it contains a `/`) or
+        starting with `query`"""
+        self.refresh()
+        if '/' in query:
+            try:
+                network = ipaddress.ip_network(query, strict=False)
+            except ValueError:
+                return set()
+            addresses = self.by_number[network.version]
+            start = bisect.bisect_left(addresses, (int(network.network_address), -1))
+            end = bisect.bisect_right(addresses, (int(network.broadcast_address), len(self.column.values)))
+            return {value_id for _, value_id in addresses[start:end]}
+        start = bisect.bisect_left(self.by_text, (query, -1))
+        matches = set()
+        for value, value_id in self.by_text[start:]:
+            if not value.startswith(query):
+                break
+            matches.add(value_id)
+        return matches
+
+def descending(postings, end):
+    """Record positions of an ascending posting list below `end`, highest first.
+    Appends to the list do not affect the iteration."""
+    for position in range(bisect.bisect_left(postings, end) - 1, -1, -1):
+        yield postings[position]
+
+class RequestIndex:
+    """The request log and its indexes.
+
+    Method and IP are hash indexed (value -> posting list), IPs also by
+    prefix and CIDR, path and user-agent by n-grams. A search resolves each
+    filter to a set of matching values, walks the posting lists of the most
+    selective filter newest first and probes the other filters through the
+    encoded columns, so its cost follows the smallest posting lists rather
+    than the size of the log.
+
+    Internally records are numbered by position; the record ids handed out
+    are positions plus `first`, which goes negative when history is put
+    before them, so ids already given out keep pointing at the same record."""
+
+    def __init__(self):
+        self.records = []
+        self.first = 0  # Record id of records[0]
+        self.lock = threading.Lock()
+        self.columns = {name: Column() for name in ('ip', 'method', 'path', 'user_agent')}
+        self.ip_index = IpIndex(self.columns['ip'])
+        self.text_indexes = {
+            'path': NgramIndex(self.columns['path']),
+            'user_agent': NgramIndex(self.columns['user_agent']),
+        }
+
+    def add(self, record):
+        # Positions in `records` are indexed, so appends are serialized
+        with self.lock:
+            position = len(self.records)
+            for name, column in self.columns.items():
+                value_id, new = column.add(position, record[name])
+                if new:
+                    if name == 'ip':
+                        self.ip_index.add(value_id, record[name])
+                    elif name in self.text_indexes:
+                        self.text_indexes[name].add(value_id, record[name])
+            self.records.append(record)
+
+    def prepend(self, history):
+        """Put the records of `history`, an index built aside, before the
+        ones held. Only the records held are indexed again under the lock,
+        so requests keep being logged while the history is built. The
+        history gets the ids below the held ones, which keep theirs."""
+        with self.lock:
+            self.first -= len(history.records)
+            for record in self.records:
+                history.add(record)
+            self.records = history.records
+            self.columns = history.columns
+            self.ip_index = history.ip_index
+            self.text_indexes = history.text_indexes
+
+    def __len__(self):
+        return len(self.records)
+
+    def filters(self, ip, user_agent, method, path):
+        """(column name, matching value ids) of each given filter"""
+        filters = []
+        if ip:
+            filters.append(('ip', self.ip_index.matching(ip)))
+        if method:
+            value_id = self.columns['method'].ids.get(method)
+            filters.append(('method', set() if value_id is None else {value_id}))
+        if user_agent:
+            filters.append(('user_agent', self.text_indexes['user_agent'].matching(user_agent)))
+        if path:
+            filters.append(('path', self.text_indexes['path'].matching(path)))
+        return filters
+
+    def search(self, ip='', user_agent='', method='', path='', before=None):
+        """(record id, record) of the records matching every given filter,
+        newest first, starting below the record id `before`: IP by prefix or
+        CIDR, method exactly, user-agent and path by lowercase substring.
+
+        Lazy: reading the first page costs that page, not the whole match.
+        Records added meanwhile are not included, so ids stay valid cursors."""
+        with self.lock:
+            first = self.first
+            end = len(self.records) if before is None else max(0, min(before - first, len(self.records)))
+            filters = self.filters(ip, user_agent, method, path)
+            if not filters:
+                records = self.records
+                return ((first + position, records[position]) for position in range(end - 1, -1, -1))
+            # Drive from the filter with the fewest matching records
+            sizes = [
+                sum(len(self.columns[name].postings[value_id]) for value_id in value_ids)
+                for name, value_ids in filters
+            ]
+            driver = sizes.index(min(sizes))
+            name, value_ids = filters.pop(driver)
+            postings = [
+                descending(self.columns[name].postings[value_id], end) for value_id in value_ids
+            ]
+            probes = [(self.columns[name].codes, value_ids) for name, value_ids in filters]
+            # Taken with the postings: prepend() swaps in a longer list
+            records = self.records
+        return (
+            (first + position, records[position])
+            for position in heapq.merge(*postings, reverse=True)
+            if all(codes[position] in value_ids for codes, value_ids in probes)
+        )
+
+    def count(self, ip='', user_agent='', method='', path=''):
+        if not (ip or user_agent or method or path):
+            return len(self.records)
+        return sum(1 for _ in self.search(ip, user_agent, method, path))
@@ -0,0 +1,313 @@
+import os
+import sys
+import json
+import glob
+import gzip
+import time
+import zlib
+import fcntl
+import struct
+import hashlib
+import atexit
+import argparse
+import threading
+from itertools import count
+
+# Requests are appended to segment files in LOG_DIR, one open segment per
+# process; a segment is sealed (gzip-compressed, with an index) once it
+# reaches SEGMENT_MAX_BYTES or is SEGMENT_MAX_AGE seconds old
+LOG_DIR = os.environ.get('LOG_DIR', '/captures/segments')
+SEGMENT_MAX_BYTES = int(os.environ.get('SEGMENT_MAX_BYTES', str(64 * 1024 * 1024)))
+SEGMENT_MAX_AGE = float(os.environ.get('SEGMENT_MAX_AGE', '3600'))
+# 'batch' fsyncs after every written batch, 'interval' at most every
+# LOG_FSYNC_INTERVAL seconds, 'never' leaves it to the OS
+LOG_FSYNC = os.environ.get('LOG_FSYNC', 'interval')
+LOG_FSYNC_INTERVAL = float(os.environ.get('LOG_FSYNC_INTERVAL', '1'))
+LOG_BUFFER_SIZE = int(os.environ.get('LOG_BUFFER_SIZE', str(1024 * 1024)))
+# Single log file written before segments existed; read as the oldest segment
+LOG_FILE = os.environ.get('LOG_FILE', '/captures/requests.jsonl')
+
+ACTIVE = '.jsonl'
+SEALED = '.jsonl.gz'
+# gzip extra subfield holding the index of a sealed segment
+INDEX_FIELD = b'RQ'
+BLOOM_HASHES = 7
+BLOOM_BITS_PER_KEY = 10
+# A gzip extra subfield holds at most 65535 bytes
+MAX_BLOOM_BYTES = 60000
+
+class BloomFilter:
+    """Set membership with false positives only, in `size` bytes"""
+
+    def __init__(self, size, bits=None):
+        self.bits = bytearray(size) if bits is None else bytearray(bits)
+        self.size = len(self.bits) * 8
+
+    @classmethod
+    def for_keys(cls, keys):
+        size = min(max(64, len(keys) * BLOOM_BITS_PER_KEY // 8 + 1), MAX_BLOOM_BYTES)
+        bloom = cls(size)
+        for key in keys:
+            bloom.add(key)
+        return bloom
+
+    def positions(self, key):
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        h1, h2 = struct.unpack('<QQ', digest)
+        return [(h1 + i * h2) % self.size for i in range(BLOOM_HASHES)]
+
+    def add(self, key):
+        for position in self.positions(key):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, key):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self.positions(key))
+
+class Segment:
+    """One segment file: active (plain JSONL, still appended to) or sealed
+    (gzip, with an index in the gzip header)"""
+
+    def __init__(self, path):
+        self.path = path
+        self.sealed = path.endswith(SEALED)
+        self.name = os.path.basename(path)[:-len(SEALED if self.sealed else ACTIVE)]
+        self._index = None
+
+    def __repr__(self):
+        return f'Segment({self.path!r})'
+
+    @property
+    def index(self):
+        """{'first', 'last', 'count', 'bloom'} of a sealed segment, None for
+        an active one"""
+        if self.sealed and self._index is None:
+            self._index = read_index(self.path)
+        return self._index
+
+    def may_contain(self, since=None, until=None, ip=None):
+        """False when the index rules out any record matching the filters"""
+        index = self.index
+        if index is None:
+            return True
+        if index['count'] == 0:
+            return False
+        if since is not None and index['last'] < since:
+            return False
+        if until is not None and index['first'] > until:
+            return False
+        return ip is None or ip in index['bloom']
+
+    def lines(self, offset=0):
+        """Complete lines from byte `offset` of the uncompressed content; a
+        line still being written is left out"""
+        with (gzip.open(self.path, 'rb') if self.sealed else open(self.path, 'rb')) as f:
+            f.seek(offset)
+            for line in f:
+                if not line.endswith(b'\n'):
+                    return
+                yield line
+
+    def records(self, since=None, until=None, ip=None):
+        for line in self.lines():
+            try:
+                req = json.loads(line)
+            except ValueError:
+                continue
+            if since is not None and req['timestamp'] < since:
+                continue
+            if until is not None and req['timestamp'] > until:
+                continue
+            if ip is not None and req['ip'] != ip:
+                continue
+            yield req
+
+def segments(directory=None, legacy=None):
+    """Segments oldest first, the legacy log file before all of them. A
+    segment sealed while its active file is still around counts as sealed."""
+    directory = LOG_DIR if directory is None else directory
+    legacy = LOG_FILE if legacy is None else legacy
+    found = {}
+    for path in glob.glob(os.path.join(directory, '*' + ACTIVE)) + glob.glob(os.path.join(directory, '*' + SEALED)):
+        segment = Segment(path)
+        if segment.sealed or segment.name not in found:
+            found[segment.name] = segment
+    ordered = [found[name] for name in sorted(found)]
+    if legacy and os.path.exists(legacy):
+        ordered.insert(0, Segment(legacy))
+    return ordered
+
+def read(since=None, until=None, ip=None, directory=None):
+    """Logged requests matching the filters, oldest first. Timestamps are
+    compared as '%Y-%m-%d %H:%M:%S' strings; sealed segments that cannot
+    match are skipped without being decompressed."""
+    for segment in segments(directory):
+        if segment.may_contain(since, until, ip):
+            yield from segment.records(since, until, ip)
+
+def read_index(path):
+    with open(path, 'rb') as f:
+        header = f.read(12)
+        if len(header) < 12 or header[:2] != b'\x1f\x8b' or not header[3] & 0x04:
+            return None
+        extra = f.read(struct.unpack('<H', header[10:12])[0])
+    position = 0
+    while position + 4 <= len(extra):
+        field, length = extra[position:position + 2], struct.unpack('<H', extra[position + 2:position + 4])[0]
+        data = extra[position + 4:position + 4 + length]
+        if field == INDEX_FIELD:
+            summary, bloom = data.split(b'\n', 1)
+            index = json.loads(summary)
+            index['bloom'] = BloomFilter(0, bloom)
+            return index
+        position += 4 + length
+    return None
+
+def seal(path):
+    """Compress an active segment into a gzip file whose header carries its
+    time range and a bloom filter of its IPs, then remove it. Still valid
+    gzip: zcat and gzip.open() read it as usual.
+
+    Returns False, leaving it alone, while its writer holds its lock (or
+    another process seals it)."""
+    first = last = None
+    ips = set()
+    records = 0
+    compressor = zlib.compressobj(6, zlib.DEFLATED, -zlib.MAX_WBITS)
+    body = []
+    crc = size = 0
+    with open(path, 'rb') as f:
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return False
+        if os.fstat(f.fileno()).st_nlink == 0:
+            return False  # Sealed and removed by another process since we opened it
+        for line in f:
+            if not line.endswith(b'\n'):
+                line += b'\n'  # Torn last write of a crashed process
+            try:
+                req = json.loads(line)
+            except ValueError:
+                req = None
+            if req is not None:
+                records += 1
+                ips.add(req['ip'])
+                timestamp = req['timestamp']
+                first = timestamp if first is None or timestamp < first else first
+                last = timestamp if last is None or timestamp > last else last
+            crc = zlib.crc32(line, crc)
+            size += len(line)
+            body.append(compressor.compress(line))
+        body.append(compressor.flush())
+        summary = json.dumps({'first': first, 'last': last, 'count': records}).encode()
+        field = summary + b'\n' + BloomFilter.for_keys(ips).bits
+        extra = INDEX_FIELD + struct.pack('<H', len(field)) + field
+        header = b'\x1f\x8b\x08\x04' + struct.pack('<I', int(time.time())) + b'\x00\xff' + struct.pack('<H', len(extra))
+        sealed = path[:-len(ACTIVE)] + SEALED
+        temporary = f'{sealed}.{os.getpid()}.tmp'
+        with open(temporary, 'wb') as out:
+            out.write(header + extra)
+            out.writelines(body)
+            out.write(struct.pack('<II', crc, size & 0xffffffff))
+            out.flush()
+            os.fsync(out.fileno())
+        os.replace(temporary, sealed)
+        # Removed while still locked, so no other process seals it again
+        os.unlink(path)
+    return True
+
+class SegmentWriter:
+    """Appends batches of requests to this process's active segment through
+    one buffered handle, and rotates it by size and age. Sealing runs in
+    its own thread so that writing goes on meanwhile."""
+
+    def __init__(self, directory=None):
+        self.directory = LOG_DIR if directory is None else directory
+        self.sequence = count()
+        self.file = None
+        self.path = None
+        self.opened = 0
+        self.synced = 0
+        self.lock = threading.Lock()
+        atexit.register(self.close)
+
+    def open(self):
+        os.makedirs(self.directory, exist_ok=True)
+        # Names sort by creation time; the pid keeps worker processes apart
+        name = f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-{next(self.sequence):04d}"
+        self.path = os.path.join(self.directory, name + ACTIVE)
+        # Locked for as long as it is written, which tells other processes
+        # it is not abandoned; locked before it appears under its name
+        temporary = f'{self.path}.new'
+        self.file = open(temporary, 'ab', buffering=LOG_BUFFER_SIZE)
+        fcntl.flock(self.file, fcntl.LOCK_EX)
+        os.rename(temporary, self.path)
+        self.opened = time.monotonic()
+        threading.Thread(target=self.seal_abandoned, name='segment-seal', daemon=True).start()
+
+    def write(self, batch):
+        with self.lock:
+            now = time.monotonic()
+            # Checked before writing, so an idle segment is rotated on the
+            # next batch rather than after it
+            if self.file is not None and now - self.opened >= SEGMENT_MAX_AGE:
+                self.rotate()
+            if self.file is None:
+                self.open()
+            self.file.write(''.join(json.dumps(request_data) + '\n' for request_data in batch).encode())
+            # Flushed per batch so that readers see whole batches
+            self.file.flush()
+            if LOG_FSYNC == 'batch' or (LOG_FSYNC == 'interval' and now - self.synced >= LOG_FSYNC_INTERVAL):
+                os.fsync(self.file.fileno())
+                self.synced = now
+            if self.file.tell() >= SEGMENT_MAX_BYTES:
+                self.rotate()
+
+    def rotate(self):
+        path = self.path
+        self.close_file()
+        threading.Thread(target=self.seal, args=(path,), name='segment-seal', daemon=True).start()
+
+    def seal(self, path):
+        try:
+            seal(path)
+        except FileNotFoundError:
+            pass  # Already sealed by another process
+        except Exception as e:
+            print(f"Error sealing {path}: {e}", file=sys.stderr)
+
+    def seal_abandoned(self):
+        """Seal the active segments of processes that stopped writing them:
+        those whose lock no process holds"""
+        for path in glob.glob(os.path.join(self.directory, '*' + ACTIVE)):
+            self.seal(path)
+
+    def close_file(self):
+        if self.file is not None:
+            self.file.flush()
+            if LOG_FSYNC != 'never':
+                os.fsync(self.file.fileno())
+            self.file.close()
+            self.file = None
+
+    def close(self):
+        """Flush and close the active segment; it is sealed by the next
+        process to open one"""
+        with self.lock:
+            self.close_file()
+
+def main():
+    parser = argparse.ArgumentParser(description='Print logged requests as JSONL, oldest first')
+    parser.add_argument('--ip', help='exact client IP')
+    parser.add_argument('--since', help="first timestamp, e.g. '2024-01-31 00:00:00'")
+    parser.add_argument('--until', help='last timestamp')
+    parser.add_argument('--dir', help=f'segment directory (default {LOG_DIR})')
+    args = parser.parse_args()
+    try:
+        for req in read(args.since, args.until, args.ip, args.dir):
+            sys.stdout.write(json.dumps(req) + '\n')
+    except BrokenPipeError:
+        pass
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,140 @@
+import os
+import sys
+import json
+import time
+import fcntl
+import marshal
+from collections import deque
+import segments
+from counters import Summary, new_counts
+
+# Binary snapshot of the state loaded from the log segments, and the byte
+# offset reached in each; startup replays only the lines written after it
+SNAPSHOT_FILE = os.environ.get('SNAPSHOT_FILE', '/captures/requests.snapshot')
+# Seconds between two snapshots
+SNAPSHOT_INTERVAL = float(os.environ.get('SNAPSHOT_INTERVAL', '300'))
+# Most recent requests kept in the snapshot and shown on /requests after a
+# restart; IP counts always cover the whole log
+STARTUP_HISTORY = int(os.environ.get('STARTUP_HISTORY', '100000'))
+
+MAGIC = b'REQSNAP2'
+
+class History:
+    """IP counts and most recent requests of the segments read so far:
+    `positions` holds the offset reached in each segment still being
+    written, `complete` the sealed segments read to the end"""
+
+    def __init__(self, counts=None, recent=(), positions=None, complete=()):
+        self.counts = new_counts() if counts is None else counts
+        self.recent = deque(recent, maxlen=STARTUP_HISTORY or None)
+        self.positions = {} if positions is None else positions
+        self.complete = set(complete)
+
+    @classmethod
+    def load(cls, snapshot_file):
+        """The snapshot, or an empty history when it is missing or unreadable"""
+        try:
+            with open(snapshot_file, 'rb') as f:
+                data = f.read()
+            if not data.startswith(MAGIC):
+                return cls()
+            # One read: marshal.load() on a file reads it a few bytes at a time
+            state = marshal.loads(data[len(MAGIC):])
+            summary = Summary(state['counts'], state['floor'])
+            return cls(new_counts(summary), state['recent'], state['positions'], state['complete'])
+        except (OSError, EOFError, ValueError, TypeError, KeyError):
+            return cls()
+
+    def catch_up(self, limits=None):
+        """Replay the complete lines written since. With `limits` (segment
+        name -> size, None for all of it), only those segments are read,
+        up to that size."""
+        for segment in segments.segments():
+            if segment.name in self.complete:
+                continue
+            limit = None
+            if limits is not None:
+                if segment.name not in limits:
+                    continue
+                limit = limits[segment.name]
+            offset = self.positions.get(segment.name, 0)
+            try:
+                for line in segment.lines(offset):
+                    if limit is not None and offset + len(line) > limit:
+                        break
+                    offset += len(line)
+                    try:
+                        req = json.loads(line)
+                    except ValueError:
+                        continue
+                    self.counts.add(req['ip'])
+                    self.recent.append(req)
+            except FileNotFoundError:
+                continue  # Sealed meanwhile: read from the sealed file next time
+            if segment.sealed and limit is None:
+                self.complete.add(segment.name)
+                self.positions.pop(segment.name, None)
+            else:
+                self.positions[segment.name] = offset
+
+    def save(self, snapshot_file):
+        """Write the snapshot atomically"""
+        summary = self.counts.summary()
+        state = {
+            'positions': self.positions,
+            'complete': list(self.complete),
+            'counts': summary.counts,
+            'floor': summary.floor,
+            'recent': list(self.recent),
+        }
+        temporary = f'{snapshot_file}.{os.getpid()}.tmp'
+        with open(temporary, 'wb') as f:
+            f.write(MAGIC + marshal.dumps(state))
+        os.replace(temporary, snapshot_file)
+
+def startup_limits():
+    """Current size of every segment, so that startup loads what was written
+    before it. Lines appended later are this process's own requests or
+    another worker's."""
+    limits = {}
+    for segment in segments.segments():
+        try:
+            limits[segment.name] = None if segment.sealed else os.path.getsize(segment.path)
+        except FileNotFoundError:
+            limits[segment.name] = None  # Just sealed
+    return limits
+
+def refresh(snapshot_file=SNAPSHOT_FILE, limits=None, wait=True):
+    """Load the snapshot, replay the lines after it and save it again.
+    Worker processes sharing the log take turns through a lock file; with
+    `wait` false, returns None instead of waiting for another one."""
+    with open(f'{snapshot_file}.lock', 'a') as lock:
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX if wait else fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return None
+        history = History.load(snapshot_file)
+        previous = (dict(history.positions), len(history.complete))
+        history.catch_up(limits)
+        if (history.positions, len(history.complete)) != previous:
+            history.save(snapshot_file)
+        return history
+
+def run(limits, on_load):
+    """Background loading: pass the history of the segments up to `limits`
+    (see startup_limits) to `on_load`, then refresh the snapshot every
+    SNAPSHOT_INTERVAL seconds"""
+    try:
+        history = refresh(limits=limits)
+    except OSError as e:
+        print(f"Error loading snapshot: {e}", file=sys.stderr)
+        history = History()
+        history.catch_up(limits)
+    on_load(history)
+    del history  # Its records now belong to the caller
+    while True:
+        time.sleep(SNAPSHOT_INTERVAL)
+        try:
+            refresh(wait=False)
+        except OSError as e:
+            print(f"Error saving snapshot: {e}", file=sys.stderr)